@@ -2,75 +2,50 @@
 """Bead Data Visualization in Streamlit"""
 
 import streamlit as st
-import pandas as pd
-import zipfile
-import os
-import plotly.graph_objects as go
+from line4 import iter_moments, plan
+from line4.figures import bead_mean_figure
+from line4.ui import open_upload, show_chart, show_profile, show_quarantine, start_profiling
 
 # Set page layout to wide
 st.set_page_config(layout="wide")
 
-# Function to extract zip file
-def extract_zip(uploaded_file):
-    with zipfile.ZipFile(uploaded_file, 'r') as z:
-        z.extractall('data')
-    return 'data'
-
-# Function to list folders
-def list_folders(path):
-    return sorted([f for f in os.listdir(path) if os.path.isdir(os.path.join(path, f))])
-
-# Function to load CSV files
-def load_csv_files(path):
-    csv_files = [os.path.join(path, f) for f in os.listdir(path) if f.endswith('.csv')]
-    data = []
-    for csv_file in csv_files:
-        df = pd.read_csv(csv_file, header=None)
-        data.append(df)
-    return data
-
-# Function to plot data with average by bead number
-def plot_data(data, identifier):
-    fig = go.Figure()
-
-    for df in data:
-        # Filter data for the specified identifier (e.g., Ch01, Ch02, Ch03)
-        subset = df[df[0] == identifier]
-        
-        # Group data by Bead/Segment Number and calculate mean
-        means = subset.iloc[:, 1:].mean(axis=0)  # Calculates mean across rows for each bead
-        bead_numbers = list(range(1, len(means) + 1))  # Assuming bead numbers are sequential
-        
-        # Plot data
-        fig.add_trace(go.Scatter(x=bead_numbers, y=means, mode='lines+markers', name=f'{identifier} Mean'))
-    
-    fig.update_layout(
-        title=f'{identifier} Bead Data (Averaged)',
-        xaxis_title='Bead Number',
-        yaxis_title='Average Value'
-    )
-    st.plotly_chart(fig)
-
 # Streamlit UI
 st.title('Bead Data Visualization (Averaged by Bead Number)')
 
+# Optional stage timings (extract, list, parse, aggregate, plot) in the sidebar
+recorder = start_profiling()
+
 # File uploader
 uploaded_file = st.file_uploader("Upload a ZIP file", type="zip")
 
 if uploaded_file is not None:
-    # Extract ZIP file
-    data_dir = extract_zip(uploaded_file)
+    # Open memory-mapped store of the ZIP file
+    dataset = open_upload(uploaded_file, 'memmap')
     
     # List and sort base folders
-    base_folder = st.selectbox('Select Folder', list_folders(data_dir))
+    base_folder = st.selectbox('Select Folder', dataset.list_folders())
     
     if base_folder:
         # List and sort date folders
-        date_folder = st.selectbox('Select Date', list_folders(os.path.join(data_dir, base_folder)))
+        date_folder = st.selectbox('Select Date', dataset.list_folders(base_folder))
         
         if date_folder:
-            # Load and plot data
-            data = load_csv_files(os.path.join(data_dir, base_folder, date_folder))
-            for identifier in ['Ch01', 'Ch02', 'Ch03']:
-                st.subheader(f'Plot for {identifier}')
-                plot_data(data, identifier)
+            # Channels to show; only these partitions are loaded
+            channels = st.multiselect('Select Channels', ['Ch01', 'Ch02', 'Ch03'], default=['Ch01', 'Ch02', 'Ch03'])
+
+            # Overlay of all files of the date merged bead by bead
+            show_average = st.sidebar.checkbox('Average across files')
+
+            # Plot the per-file bead means of each planned channel; they come from the bead
+            # moments recorded when the date folder was converted, the raw values are not read
+            partitions = plan(dataset, [base_folder], channels, dates=[date_folder])
+            for partition, moments in iter_moments(dataset, partitions):
+                st.subheader(f'Plot for {partition.channel}')
+                show_chart(st, bead_mean_figure(moments, partition.channel, show_average))
+
+# Malformed files skipped while loading, with the reasons
+if uploaded_file is not None:
+    show_quarantine(dataset)
+
+# Stage timings of this run
+show_profile(recorder)
@@ -2,73 +2,72 @@
 """Bead Data Visualization in Streamlit"""
 
 import streamlit as st
-import pandas as pd
-import zipfile
-import os
-import plotly.graph_objects as go
+from line4 import bead_means, date_bead_means, plan, stream_folder_stats
+from line4.downsample import GRID_METHODS
+from line4.figures import bead_heatmap_figure, date_average_figure
+from line4.ui import (aggregates_for, load_progress, open_upload, select_workers, show_chart, show_profile,
+                      show_quarantine, start_profiling)
 
 # Set page layout to wide
 st.set_page_config(layout="wide")
 
-# Function to extract zip file
-def extract_zip(uploaded_file):
-    with zipfile.ZipFile(uploaded_file, 'r') as z:
-        z.extractall('data')
-    return 'data'
-
-# Function to list folders
-def list_folders(path):
-    return sorted([f for f in os.listdir(path) if os.path.isdir(os.path.join(path, f))])
-
-# Function to load CSV files and aggregate data by date
-def load_and_aggregate_data(path):
-    date_data = {}
-    date_folders = list_folders(path)
-
-    for date_folder in date_folders:
-        csv_files = [os.path.join(path, date_folder, f) for f in os.listdir(os.path.join(path, date_folder)) if f.endswith('.csv')]
-        for csv_file in csv_files:
-            df = pd.read_csv(csv_file, header=None)
-            for identifier in ['Ch01', 'Ch02', 'Ch03']:
-                subset = df[df[0] == identifier]
-                if identifier not in date_data:
-                    date_data[identifier] = []
-                date_data[identifier].append(subset.iloc[:, 1:].mean(axis=0))  # Aggregate means by bead number
-
-    # Convert lists of means to averages by date
-    for identifier in date_data:
-        date_data[identifier] = pd.DataFrame(date_data[identifier]).mean(axis=0)  # Average across all date-specific means
-    return date_data, date_folders
-
-# Function to plot data with average by date
-def plot_data(data, date_folders):
-    for identifier, averages in data.items():
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=date_folders, y=averages, mode='lines+markers', name=f'{identifier} Average'))
-
-        fig.update_layout(
-            title=f'{identifier} Bead Data (Averaged by Date)',
-            xaxis_title='Date',
-            yaxis_title='Average Value'
-        )
-        st.plotly_chart(fig)
-
 # Streamlit UI
 st.title('Bead Data Visualization (Averaged by Date)')
 
+# Optional stage timings (extract, list, parse, aggregate, plot) in the sidebar
+recorder = start_profiling()
+
 # File uploader
-uploaded_file = st.file_uploader("Upload a ZIP file", type="zip")
+uploaded_file = st.file_uploader("Upload a ZIP file or a precomputed summary", type=["zip", "parquet"])
 
 if uploaded_file is not None:
-    # Extract ZIP file
-    data_dir = extract_zip(uploaded_file)
+    # Open columnar store of the ZIP file (or the summary file as it is)
+    dataset = open_upload(uploaded_file, 'columnar')
+
+    # Number of worker processes parsing date folders in parallel
+    dataset, workers = select_workers(dataset)
+
+    # Bead heatmaps: where along the weld each date deviates, pooled to at most this many cells per axis
+    show_heatmaps = st.sidebar.checkbox('Show bead heatmaps', value=True)
+    heatmap_cells = st.sidebar.slider('Heatmap cells per axis', min_value=50, max_value=1000, value=400, step=50)
+    heatmap_method = st.sidebar.selectbox('Pool heatmap cells by', GRID_METHODS)
 
     # List and sort base folders
-    base_folder = st.selectbox('Select Folder', list_folders(data_dir))
+    base_folder = st.selectbox('Select Folder', dataset.list_folders())
     
     if base_folder:
-        # Load and aggregate data
-        data, date_folders = load_and_aggregate_data(os.path.join(data_dir, base_folder))
+        # Plan the (folder, date, channel) partitions of the view, then load and aggregate them.
+        # Per-date statistics are read from the summary or the store when the folder is unchanged, otherwise
+        # read and parsed concurrently (in worker processes when workers > 1) and recorded
+        date_folders = dataset.list_folders(base_folder)
+        partitions = plan(dataset, [base_folder], dates=date_folders)
+        data = {}
+        grids = {}
+        loading = stream_folder_stats(dataset, partitions, workers, aggregates_for(dataset), load_progress())
+        for _, folder_stats in loading:
+            # Pool every file of every date by bead number
+            data = bead_means(folder_stats)
+            # One date x bead grid of bead means per channel
+            grids = date_bead_means(folder_stats) if show_heatmaps else {}
         
         # Plot the aggregated data for each identifier
-        plot_data(data, date_folders)
+        for identifier, averages in data.items():
+            show_chart(st, date_average_figure(averages, identifier, date_folders))
+
+        # Plot the date x bead grids, optionally zoomed into a range of bead numbers
+        if grids:
+            bead_count = max(grid.shape[1] for _, grid in grids.values())
+            if bead_count > 1:
+                beads = st.slider('Bead numbers', min_value=1, max_value=bead_count, value=(1, bead_count))
+            else:
+                beads = None
+            for identifier, (dates, grid) in grids.items():
+                show_chart(st, bead_heatmap_figure(dates, grid, identifier, heatmap_cells, heatmap_cells,
+                                                   heatmap_method, beads))
+
+# Malformed files skipped while loading, with the reasons
+if uploaded_file is not None:
+    show_quarantine(dataset)
+
+# Stage timings of this run
+show_profile(recorder)
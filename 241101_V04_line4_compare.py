@@ -2,99 +2,59 @@
 """Bead Data Visualization in Streamlit"""
 
 import streamlit as st
-import pandas as pd
-import zipfile
-import os
-import plotly.graph_objects as go
+from line4 import date_means, plan, stream_folder_stats
+from line4.figures import date_mean_figure
+from line4.ui import (aggregates_for, load_progress, open_upload, select_workers, show_chart, show_profile,
+                      show_quarantine, start_profiling)
 
 # Set page layout to wide
 st.set_page_config(layout="wide")
 
-# Function to extract zip file
-def extract_zip(uploaded_file):
-    with zipfile.ZipFile(uploaded_file, 'r') as z:
-        z.extractall('data')
-    return 'data'
-
-# Function to list folders
-def list_folders(path):
-    return sorted([f for f in os.listdir(path) if os.path.isdir(os.path.join(path, f))])
-
-# Function to load CSV files and aggregate data by date
-def load_and_aggregate_data(path):
-    date_data = {}
-    date_folders = list_folders(path)
-
-    for date_folder in date_folders:
-        csv_files = [os.path.join(path, date_folder, f) for f in os.listdir(os.path.join(path, date_folder)) if f.endswith('.csv')]
-        for csv_file in csv_files:
-            df = pd.read_csv(csv_file, header=None)
-            for identifier in ['Ch01', 'Ch02', 'Ch03']:
-                subset = df[df[0] == identifier]
-                if identifier not in date_data:
-                    date_data[identifier] = {}
-                # Store mean values for each date
-                date_data[identifier][date_folder] = subset.iloc[:, 1:].mean(axis=0).mean()
-
-    return date_data
-
-# Function to plot data with average by date for multiple folders
-def plot_data(data_dict):
-    for identifier in ['Ch01', 'Ch02', 'Ch03']:
-        fig = go.Figure()
-        
-        # Get unique dates across all folders for the current identifier
-        all_dates = sorted(set(date for folder_data in data_dict.values() for date in folder_data[identifier].keys()))
-        
-        for folder_name, folder_data in data_dict.items():
-            y_values = [folder_data[identifier].get(date, None) for date in all_dates]  # Use None for missing dates
-            fig.add_trace(go.Scatter(
-                x=all_dates,
-                y=y_values,
-                mode='lines+markers',
-                name=f'{identifier} - {folder_name}'
-            ))
-
-        # Change the title based on the identifier
-        if identifier == 'Ch01':
-            title = 'NIR Bead Data (Averaged by Date)'
-        elif identifier == 'Ch02':
-            title = 'VIS Bead Data (Averaged by Date)'
-        elif identifier == 'Ch03':
-            title = 'LO Bead Data (Averaged by Date)'
-        else:
-            title = f'{identifier} Bead Data (Averaged by Date)'  # Fallback for unexpected identifiers
-
-        fig.update_layout(
-            title=title,
-            xaxis_title='Date',
-            yaxis_title='Average Value'
-        )
-        st.plotly_chart(fig)
-
-
 # Streamlit UI
 st.title('Bead Data Visualization (Averaged by Date)')
 
+# Optional stage timings (extract, list, parse, aggregate, plot) in the sidebar
+recorder = start_profiling()
+
 # File uploader
-uploaded_file = st.file_uploader("Upload a ZIP file", type="zip")
+uploaded_file = st.file_uploader("Upload a ZIP file or a precomputed summary", type=["zip", "parquet"])
 
 if uploaded_file is not None:
-    # Extract ZIP file
-    data_dir = extract_zip(uploaded_file)
+    # Open columnar store of the ZIP file (or the summary file as it is)
+    dataset = open_upload(uploaded_file, 'columnar')
+
+    # Number of worker processes parsing date folders in parallel
+    dataset, workers = select_workers(dataset)
 
     # List base folders
-    base_folders = list_folders(data_dir)
+    base_folders = dataset.list_folders()
     selected_folders = st.multiselect('Select Folders', base_folders)
 
     if selected_folders:
+        # Plan the (folder, date, channel) partitions of the view; nothing is read yet
+        partitions = plan(dataset, selected_folders)
+
+        # One placeholder per chart, redrawn each time another folder has been loaded
+        placeholders = {identifier: st.empty() for identifier in ['Ch01', 'Ch02', 'Ch03']}
+
         # Dictionary to hold data for each selected folder
         aggregated_data = {}
 
-        for base_folder in selected_folders:
-            # Load and aggregate data for the selected folder
-            data = load_and_aggregate_data(os.path.join(data_dir, base_folder))
-            aggregated_data[base_folder] = data
-        
-        # Plot the aggregated data for each identifier
-        plot_data(aggregated_data)
+        # Per-date statistics are read from the summary or the store when a folder is unchanged, otherwise
+        # read and parsed concurrently (in worker processes when workers > 1) and recorded. Folders
+        # arrive as they complete; changing the selection mid-load cancels the rest
+        loading = stream_folder_stats(dataset, partitions, workers, aggregates_for(dataset), load_progress())
+        for base_folder, folder_stats in loading:
+            aggregated_data[base_folder] = date_means(folder_stats)
+
+            # Plot the aggregated data loaded so far for each identifier, in selection order
+            loaded = {folder: aggregated_data[folder] for folder in selected_folders if folder in aggregated_data}
+            for identifier, placeholder in placeholders.items():
+                show_chart(placeholder, date_mean_figure(loaded, identifier), key=f'{identifier}-{len(loaded)}')
+
+# Malformed files skipped while loading, with the reasons
+if uploaded_file is not None:
+    show_quarantine(dataset)
+
+# Stage timings of this run
+show_profile(recorder)
@@ -2,108 +2,71 @@
 """Bead Data Visualization in Streamlit"""
 
 import streamlit as st
-import pandas as pd
-import zipfile
-import os
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from line4 import date_moments, plan, stream_folder_stats
+from line4.figures import date_std_figure
+from line4.ui import (aggregates_for, flag_drift, load_progress, open_upload, select_detectors, select_workers,
+                      show_chart, show_profile, show_quarantine, start_profiling)
 
 # Set page layout to wide (must be the first command)
 st.set_page_config(layout="wide")
 
-# Function to extract zip file
-def extract_zip(uploaded_file):
-    with zipfile.ZipFile(uploaded_file, 'r') as z:
-        z.extractall('data')
-    return 'data'
-
-# Function to list folders
-def list_folders(path):
-    return sorted([f for f in os.listdir(path) if os.path.isdir(os.path.join(path, f))])
-
-# Function to load CSV files and aggregate data by date
-def load_and_aggregate_data(path):
-    date_data = {}
-    date_folders = list_folders(path)
-
-    for date_folder in date_folders:
-        csv_files = [os.path.join(path, date_folder, f) for f in os.listdir(os.path.join(path, date_folder)) if f.endswith('.csv')]
-        for csv_file in csv_files:
-            df = pd.read_csv(csv_file, header=None)
-            for identifier in ['Ch01', 'Ch02', 'Ch03']:
-                subset = df[df[0] == identifier]
-                if identifier not in date_data:
-                    date_data[identifier] = {}
-                # Store mean and std values for each date
-                mean_value = subset.iloc[:, 1:].mean(axis=0).mean()
-                std_value = subset.iloc[:, 1:].std(axis=0).mean()  # Standard deviation
-                date_data[identifier][date_folder] = (mean_value, std_value)
-
-    return date_data
-
-# Function to plot data with average and standard deviation by date for multiple folders
-def plot_data(data_dict):
-    for identifier in ['Ch01', 'Ch02', 'Ch03']:
-        # Create a figure with secondary y-axis
-        fig = make_subplots(specs=[[{"secondary_y": True}]])
-
-        # Get unique dates across all folders for the current identifier
-        all_dates = sorted(set(date for folder_data in data_dict.values() for date in folder_data[identifier].keys()))
-
-        for folder_name, folder_data in data_dict.items():
-            y_mean = [folder_data[identifier].get(date, (None, None))[0] for date in all_dates]  # Mean values
-            y_std = [folder_data[identifier].get(date, (None, None))[1] for date in all_dates]  # Std deviation values
-
-            # Plot mean values on primary y-axis
-            fig.add_trace(go.Scatter(
-                x=all_dates,
-                y=y_mean,
-                mode='lines+markers',
-                name=f'{identifier} Mean - {folder_name}'
-            ), secondary_y=False)
-
-            # Plot standard deviation values on secondary y-axis
-            fig.add_trace(go.Scatter(
-                x=all_dates,
-                y=y_std,
-                mode='lines+markers',
-                name=f'{identifier} Std Dev - {folder_name}',
-                line=dict(dash='dash')  # Dashed line for standard deviation
-            ), secondary_y=True)
-
-        # Update layout for the figure
-        fig.update_layout(
-            title=f'{identifier} Bead Data (Averaged by Date)',
-            xaxis_title='Date',
-            yaxis_title='Mean Value',
-            yaxis2_title='Standard Deviation',
-            legend_title='Legend'
-        )
-        
-        st.plotly_chart(fig)
-
 # Streamlit UI
 st.title('Bead Data Visualization (Averaged by Date and Standard Deviation)')
 
+# Optional stage timings (extract, list, parse, aggregate, detect, plot) in the sidebar
+recorder = start_profiling()
+
 # File uploader
-uploaded_file = st.file_uploader("Upload a ZIP file", type="zip")
+uploaded_file = st.file_uploader("Upload a ZIP file or a precomputed summary", type=["zip", "parquet"])
 
 if uploaded_file is not None:
-    # Extract ZIP file
-    data_dir = extract_zip(uploaded_file)
+    # Open columnar store of the ZIP file (or the summary file as it is)
+    dataset = open_upload(uploaded_file, 'columnar')
+
+    # Number of worker processes parsing date folders in parallel
+    dataset, workers = select_workers(dataset)
+
+    # Detectors whose flagged points are overlaid once every folder is loaded
+    detectors = select_detectors()
 
     # List base folders
-    base_folders = list_folders(data_dir)
+    base_folders = dataset.list_folders()
     selected_folders = st.multiselect('Select Folders', base_folders)
 
     if selected_folders:
-        # Dictionary to hold data for each selected folder
+        # Plan the (folder, date, channel) partitions of the view; nothing is read yet
+        partitions = plan(dataset, selected_folders)
+
+        # One placeholder per chart, redrawn each time another folder has been loaded
+        placeholders = {identifier: st.empty() for identifier in ['Ch01', 'Ch02', 'Ch03']}
+
+        # Dictionaries to hold data for each selected folder: per-date (mean, std) and the bead statistics behind them
         aggregated_data = {}
+        bead_stats = {}
+
+        # Per-date statistics are read from the summary or the store when a folder is unchanged, otherwise
+        # read and parsed concurrently (in worker processes when workers > 1) and recorded. Folders
+        # arrive as they complete; changing the selection mid-load cancels the rest
+        loading = stream_folder_stats(dataset, partitions, workers, aggregates_for(dataset), load_progress())
+        for base_folder, folder_stats in loading:
+            aggregated_data[base_folder] = date_moments(folder_stats)
+            bead_stats[base_folder] = folder_stats
+
+            # Plot the aggregated data loaded so far for each identifier, in selection order
+            loaded = {folder: aggregated_data[folder] for folder in selected_folders if folder in aggregated_data}
+            for identifier, placeholder in placeholders.items():
+                show_chart(placeholder, date_std_figure(loaded, identifier), key=f'{identifier}-{len(loaded)}')
+
+        # Score all folders at once on their aggregates and redraw with the flagged points
+        loaded_stats = {folder: bead_stats[folder] for folder in selected_folders if folder in bead_stats}
+        for identifier, placeholder in placeholders.items():
+            anomalies = flag_drift(loaded_stats, identifier, detectors)
+            if anomalies:
+                show_chart(placeholder, date_std_figure(loaded, identifier, anomalies), key=f'{identifier}-drift')
+
+# Malformed files skipped while loading, with the reasons
+if uploaded_file is not None:
+    show_quarantine(dataset)
 
-        for base_folder in selected_folders:
-            # Load and aggregate data for the selected folder
-            data = load_and_aggregate_data(os.path.join(data_dir, base_folder))
-            aggregated_data[base_folder] = data
-        
-        # Plot the aggregated data for each identifier
-        plot_data(aggregated_data)
+# Stage timings of this run
+show_profile(recorder)
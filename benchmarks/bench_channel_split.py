@@ -0,0 +1,84 @@
+"""Benchmark: per-channel masking vs. the single-pass split and bead reduction
+
+Builds a synthetic date tree of parsed bead CSVs in memory and times the
+original loop (one boolean mask per channel, separate pandas mean and std)
+against line4.parse.split_frame + line4.bead_moments, the path parse_csv takes,
+on the same frames.
+
+    python benchmarks/bench_channel_split.py --files 10000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from line4 import CHANNELS, bead_moments, moments_std  # noqa: E402
+from line4.parse import split_frame  # noqa: E402
+
+
+# Function to build one parsed CSV frame as parse_csv reads it: rows labelled
+# Ch01/Ch02/Ch03 in a categorical column 0, no header
+def make_frame(rng, rows, beads):
+    labels = np.repeat(CHANNELS, rows)
+    df = pd.DataFrame(rng.normal(1.0, 0.5, (len(labels), beads)), columns=range(1, beads + 1))
+    df.insert(0, 0, pd.Categorical(labels))
+    return df
+
+
+# Original per-file aggregation of V05/V06
+def legacy(frames):
+    out = []
+    for df in frames:
+        for identifier in CHANNELS:
+            subset = df[df[0] == identifier]
+            mean_value = subset.iloc[:, 1:].mean(axis=0).mean()
+            std_value = subset.iloc[:, 1:].std(axis=0).mean()
+            out.append((mean_value, std_value))
+    return out
+
+
+# Single-pass split and joint mean/std reduction
+def vectorized(frames):
+    out = []
+    for df in frames:
+        channels = split_frame(df)
+        for identifier in CHANNELS:
+            count, mean, m2 = bead_moments(channels[identifier])
+            out.append((np.nanmean(mean), np.nanmean(moments_std(count, m2))))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--rows', type=int, default=20, help='rows per channel per file')
+    parser.add_argument('--beads', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    frames = [make_frame(rng, args.rows, args.beads) for _ in range(args.files)]
+
+    start = time.perf_counter()
+    expected = legacy(frames)
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = vectorized(frames)
+    vectorized_seconds = time.perf_counter() - start
+
+    error = np.nanmax(np.abs(np.array(expected) - np.array(actual)))
+    print(f'files={args.files} rows/channel={args.rows} beads={args.beads}')
+    print(f'legacy      {legacy_seconds:8.2f} s')
+    print(f'vectorized  {vectorized_seconds:8.2f} s  ({legacy_seconds / vectorized_seconds:.1f}x)')
+    print(f'max abs difference {error:.3g}')
+
+
+if __name__ == '__main__':
+    main()
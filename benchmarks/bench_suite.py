@@ -0,0 +1,223 @@
+"""Benchmark suite: stage timings, throughput and peak RSS on synthetic archives
+
+Generates Line 4 archives with line4.synth, one per point of a scaling curve,
+and times each loader stage in a fresh process:
+
+    extract    open the ZIP and index its central directory (was extract_zip)
+    list       walk the base and date folders and their CSV members
+    parse      parse every member into per-channel matrices (was load_csv_files)
+    aggregate  per-date mean/std of every folder (was load_and_aggregate_data)
+    figures    build the V01 trace and V05 mean/std figures
+
+Results are written as JSON so runs of different versions can be compared:
+
+    python benchmarks/bench_suite.py --scale files --points 10 20 40
+    python benchmarks/bench_suite.py --compare benchmarks/results/old.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STAGES = ['extract', 'list', 'parse', 'aggregate', 'figures']
+PARAMS = ['bases', 'dates', 'files', 'beads', 'rows']
+
+
+# Function to reset the peak RSS counter of this process (Linux only; elsewhere
+# the peak stays the high-water mark since start-up)
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+# Function to read the peak RSS of this process in MiB
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 ** 2
+
+
+# Function to time one stage; fn returns a dict of counters used for throughput
+def run_stage(fn):
+    reset_peak_rss()
+    start = time.perf_counter()
+    counters = fn()
+    seconds = time.perf_counter() - start
+    result = {'seconds': seconds, 'peak_rss_mb': peak_rss_mb()}
+    for name, value in counters.items():
+        result[name] = value
+        result[f'{name}_per_s'] = value / seconds if seconds > 0 else None
+    return result
+
+
+# Function to measure every stage on one archive (runs in a child process)
+def measure(path, workers):
+    # Library import cost is not part of any stage
+    import pandas  # noqa: F401
+    import plotly.graph_objects  # noqa: F401
+
+    from line4 import ZipDataset, date_moments, iter_channels, iter_folder_stats, plan, read_channels
+    from line4.figures import date_std_figure, trace_figure
+
+    state = {}
+
+    def extract():
+        state['dataset'] = ZipDataset(path)
+        return {'mb': os.path.getsize(path) / 1024 ** 2}
+
+    def list_members():
+        dataset = state['dataset']
+        state['members'] = [m for base in dataset.list_folders() for date in dataset.list_folders(base)
+                            for m in dataset.list_files(f'{base}/{date}')]
+        return {'files': len(state['members'])}
+
+    def parse():
+        dataset = state['dataset']
+        for member in state['members']:
+            read_channels(dataset, member, cache=None)
+        return {'files': len(state['members']), 'mb': sum(map(dataset.member_size, state['members'])) / 1024 ** 2}
+
+    def aggregate():
+        dataset = state['dataset']
+        state['moments'] = {}
+        for folder, folder_stats in iter_folder_stats(dataset, plan(dataset, dataset.list_folders()), workers):
+            state['moments'][folder] = date_moments(folder_stats)
+        return {'files': len(state['members'])}
+
+    def figures():
+        dataset = state['dataset']
+        base = dataset.list_folders()[0]
+        partitions = plan(dataset, [base], dates=dataset.list_folders(base)[:1])
+        for partition, channel_data in iter_channels(dataset, partitions):
+            trace_figure(channel_data, partition.channel, 4000)
+        for identifier in ['Ch01', 'Ch02', 'Ch03']:
+            date_std_figure(state['moments'], identifier)
+        return {}
+
+    stages = {'extract': extract, 'list': list_members, 'parse': parse, 'aggregate': aggregate, 'figures': figures}
+    return {name: run_stage(stages[name]) for name in STAGES}
+
+
+# Function to describe the machine and code version a run was made on
+def environment():
+    import numpy
+    import pandas
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+# Function to print a stage x point table, with the ratio to a baseline run when given
+def report(results, baseline=None):
+    previous = {}
+    for point in (baseline or {}).get('points', []):
+        previous[tuple(point['params'][p] for p in PARAMS)] = point['stages']
+    print('  '.join(f'{p:>6}' for p in PARAMS) + '  ' + '  '.join(f'{s:>14}' for s in STAGES) + '  peak MiB')
+    for point in results['points']:
+        key = tuple(point['params'][p] for p in PARAMS)
+        cells = []
+        for stage in STAGES:
+            seconds = point['stages'][stage]['seconds']
+            cell = f'{seconds:8.3f}s'
+            if key in previous:
+                cell += f' {seconds / previous[key][stage]["seconds"]:4.2f}x'
+            cells.append(f'{cell:>14}')
+        peak = max(s['peak_rss_mb'] for s in point['stages'].values())
+        print('  '.join(f'{v:>6}' for v in key) + '  ' + '  '.join(cells) + f'  {peak:8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bases', type=int, default=2)
+    parser.add_argument('--dates', type=int, default=5)
+    parser.add_argument('--files', type=int, default=20, help='files per date folder')
+    parser.add_argument('--beads', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=20, help='rows per channel per file')
+    parser.add_argument('--bead-jitter', type=int, default=0, help='up to this many beads missing per file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--scale', choices=PARAMS, help='parameter to vary for a scaling curve')
+    parser.add_argument('--points', type=int, nargs='+', help='values of the scaled parameter')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per point, the fastest is kept')
+    parser.add_argument('--output', help='JSON file to write (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier JSON result to report ratios against')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.scale and not args.points:
+        parser.error('--scale needs --points')
+
+    # Child mode: measure one archive and print the stages as JSON
+    if args.measure:
+        json.dump(measure(args.measure, args.workers), sys.stdout)
+        return
+
+    from line4.synth import write_archive
+
+    points = args.points if args.scale else [None]
+    results = {'environment': environment(), 'scale': args.scale, 'workers': args.workers, 'points': []}
+    with tempfile.TemporaryDirectory() as directory:
+        for value in points:
+            params = {p: getattr(args, p) for p in PARAMS}
+            if args.scale:
+                params[args.scale] = value
+            path = os.path.join(directory, 'archive.zip')
+            size = write_archive(path, seed=args.seed, bead_jitter=args.bead_jitter, **params)
+            runs = []
+            for _ in range(args.repeat):
+                child = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', path,
+                                        '--workers', str(args.workers)], capture_output=True, text=True, check=True)
+                runs.append(json.loads(child.stdout))
+            stages = {stage: min((run[stage] for run in runs), key=lambda s: s['seconds']) for stage in STAGES}
+            results['points'].append({'params': params, 'archive_mb': size / 1024 ** 2, 'stages': stages})
+            print(f'{params}: {sum(s["seconds"] for s in stages.values()):.2f}s', file=sys.stderr)
+
+    output = args.output
+    if output is None:
+        stamp = results['environment']['timestamp'].replace(':', '').replace('+0000', 'Z')
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', f'{stamp}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    print(f'written to {output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""Bead analytics engine behind the Line 4 visualization apps
+
+Everything importable from here runs headless; the plotly figures live in
+line4.figures and the Streamlit widgets in line4.ui.
+"""
+
+from .backends import BACKENDS, STORES, detect_backend, open_dataset
+from .cache import ParseCache, default_cache
+from .columnar import ColumnarDataset, open_columnar
+from .datasets import ChannelData, Dataset, DirectoryDataset, ZipDataset
+from .downsample import WEBGL_THRESHOLD, downsample, downsample_grid, lttb, minmax
+from .drift import DETECTORS, DriftReport, control_rules, detect_drift, robust_z
+from .kernels import CHANNELS, bead_moments, moments_std, split_codes
+from .loader import aiter_folder_stats, stream_folder_stats
+from .memmap import BeadMatrix, BeadMoments, MemmapDataset, open_memmap
+from .parallel import DEFAULT_WORKERS, date_stats, iter_date_stats, map_date_stats
+from .parse import CHUNK_ROWS, CHUNK_THRESHOLD, chunked_stats, iter_csv_chunks, parse_csv, read_channels
+from .profiling import StageRecorder, stage, timed, use_recorder
+from .query import (Partition, bead_means, date_bead_means, date_means, date_moments, iter_channels, iter_folder_stats,
+                    iter_moments, plan)
+from .schema import QuarantineLog, SchemaError, default_quarantine
+from .stats import RunningStats
+from .store import AggregateStore
+from .summary import SummaryDataset, read_summary, write_summary
+from .workspace import Workspace, default_workspace
@@ -0,0 +1,26 @@
+"""Backend selection: open a directory, ZIP archive or columnar store as a Dataset"""
+
+import os
+
+from .columnar import MANIFEST, ColumnarDataset, open_columnar
+from .datasets import DirectoryDataset, ZipDataset
+from .memmap import open_memmap
+
+BACKENDS = {'directory': DirectoryDataset, 'zip': ZipDataset, 'columnar': ColumnarDataset}
+
+# Caching layers a source can be wrapped in (date folders are converted on first use)
+STORES = {'columnar': open_columnar, 'memmap': open_memmap}
+
+
+# Function to guess the backend of a source: a columnar store root (it has a
+# manifest), any other folder, or a ZIP archive given by path or file object
+def detect_backend(source):
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        return 'columnar' if os.path.exists(os.path.join(source, MANIFEST)) else 'directory'
+    return 'zip'
+
+
+# Function to open a source as a Dataset, optionally behind a columnar or memory-mapped store
+def open_dataset(source, backend=None, store=None):
+    dataset = BACKENDS[backend or detect_backend(source)](source)
+    return dataset if store is None else STORES[store](dataset)
@@ -0,0 +1,57 @@
+"""In-memory LRU cache of parsed bead CSVs shared across Streamlit reruns"""
+
+import threading
+from collections import OrderedDict
+
+
+# LRU cache of parsed members keyed on (archive hash, member path) and bounded
+# by the total size of the cached arrays
+class ParseCache:
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    # Cached per-channel arrays for a key, or None on a miss
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    # Store per-channel arrays and evict the least recently used entries over budget
+    def put(self, key, channels):
+        size = sum(values.nbytes for values in channels.values())
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (channels, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    # Drop every entry of one archive, or the whole cache when no hash is given
+    def evict(self, archive_hash=None):
+        with self._lock:
+            if archive_hash is None:
+                self._entries.clear()
+                self.nbytes = 0
+                return
+            for key in [k for k in self._entries if k[0] == archive_hash]:
+                self.nbytes -= self._entries.pop(key)[1]
+
+
+# Process-wide cache, survives Streamlit reruns because the module stays imported
+default_cache = ParseCache()
@@ -0,0 +1,124 @@
+"""Command line entry point: python -m line4 summarize|show|drift|workspace"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from .backends import open_dataset
+from .drift import DEFAULT_DETECTORS, DETECTORS, detect_drift
+from .kernels import CHANNELS
+from .parallel import DEFAULT_WORKERS
+from .profiling import StageRecorder, use_recorder
+from .query import date_moments, iter_folder_stats, plan
+from .schema import default_quarantine
+from .store import DEFAULT_STORE, AggregateStore
+from .summary import read_summary, write_summary
+from .workspace import DEFAULT_WORKSPACE, MAX_BYTES, Workspace
+
+
+# Function to precompute the per-date aggregates of an archive or folder tree
+def summarize(args):
+    dataset = open_dataset(args.source)
+    store = None if args.no_store else AggregateStore(args.store)
+    started = time.perf_counter()
+    try:
+        dates = write_summary(dataset, args.output, args.folders, args.workers, store)
+    finally:
+        if store is not None:
+            store.close()
+    print(f'{args.output}: {dates} date folders in {time.perf_counter() - started:.1f}s', file=sys.stderr)
+    for member, reason in default_quarantine.report(dataset.fingerprint).items():
+        print(f'skipped {member}: {reason}', file=sys.stderr)
+
+
+# Function to print the per-date mean and std of a summary file as tab-separated rows
+def show(args):
+    summary = read_summary(args.summary)
+    folders = args.folders or summary.list_folders()
+    print('folder\tdate\tchannel\tmean\tstd')
+    for folder, folder_stats in iter_folder_stats(summary, plan(summary, folders), 1, summary):
+        for channel, date_values in date_moments(folder_stats).items():
+            for date, (mean, std) in date_values.items():
+                print(f'{folder}\t{date}\t{channel}\t{mean:.6g}\t{std:.6g}')
+
+
+# Function to print the points flagged by the drift detectors as tab-separated rows
+def drift(args):
+    if args.source.endswith('.parquet'):
+        dataset = store = read_summary(args.source)
+    else:
+        dataset, store = open_dataset(args.source), None
+    folders = args.folders or dataset.list_folders()
+    data = dict(iter_folder_stats(dataset, plan(dataset, folders), 1, store))
+    print('folder\tdate\tchannel\tseries\treason')
+    for channel in CHANNELS:
+        for folder, date, field, reason in detect_drift(data, channel, args.detectors).anomalies():
+            print(f'{folder}\t{date}\t{channel}\t{("mean", "std")[field]}\t{reason}')
+
+
+# Function to list the archives kept in a workspace, evicting the least recently used first
+# (and pruning superseded aggregates from the store) when asked
+def workspace(args):
+    space = Workspace(args.root, args.max_bytes, min_age=0 if args.force else 600)
+    if args.evict:
+        for archive_hash in space.evict():
+            print(f'evicted {archive_hash}', file=sys.stderr)
+        if os.path.exists(args.store):
+            store = AggregateStore(args.store)
+            try:
+                print(f'pruned {store.prune()} aggregate rows', file=sys.stderr)
+            finally:
+                store.close()
+    print('archive\tMiB\tlast used')
+    for archive_hash, entry in sorted(space.entries().items(), key=lambda item: -item[1]['last_used']):
+        last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used'])) if entry['last_used'] else '-'
+        print(f'{archive_hash}\t{entry["bytes"] / 1024 ** 2:.1f}\t{last_used}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m line4', description='Headless Line 4 bead aggregates')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_summarize = commands.add_parser('summarize', help='write the per-date aggregates of a ZIP or folder tree')
+    parser_summarize.add_argument('source', help='ZIP archive, extracted folder tree or columnar store')
+    parser_summarize.add_argument('-o', '--output', default='summary.parquet', help='summary file to write')
+    parser_summarize.add_argument('-f', '--folders', nargs='+', help='base folders to include (default: all)')
+    parser_summarize.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS, help='worker processes')
+    parser_summarize.add_argument('--store', default=DEFAULT_STORE, help='aggregate store reused between runs')
+    parser_summarize.add_argument('--no-store', action='store_true', help='recompute every date folder')
+    parser_summarize.set_defaults(run=summarize)
+
+    parser_show = commands.add_parser('show', help='print the per-date mean and std of a summary file')
+    parser_show.add_argument('summary', help='summary file written by summarize')
+    parser_show.add_argument('-f', '--folders', nargs='+', help='base folders to print (default: all)')
+    parser_show.set_defaults(run=show)
+
+    parser_drift = commands.add_parser('drift', help='print the date folders flagged as drift or anomalies')
+    parser_drift.add_argument('source', help='summary file, ZIP archive, extracted folder tree or columnar store')
+    parser_drift.add_argument('-f', '--folders', nargs='+', help='base folders to score (default: all)')
+    parser_drift.add_argument('-d', '--detectors', nargs='+', choices=list(DETECTORS), default=list(DEFAULT_DETECTORS),
+                              help='detectors to flag with')
+    parser_drift.set_defaults(run=drift)
+
+    parser_workspace = commands.add_parser('workspace', help='list or evict the archives kept in a workspace')
+    parser_workspace.add_argument('--root', default=DEFAULT_WORKSPACE, help='workspace directory')
+    parser_workspace.add_argument('--max-bytes', type=int, default=MAX_BYTES, help='size to evict down to')
+    parser_workspace.add_argument('--evict', action='store_true', help='remove the least recently used archives')
+    parser_workspace.add_argument('--force', action='store_true',
+                                  help='also evict archives used in the last 10 minutes')
+    parser_workspace.add_argument('--store', default=DEFAULT_STORE, help='aggregate store to prune on --evict')
+    parser_workspace.set_defaults(run=workspace)
+
+    parser.add_argument('--profile', action='store_true',
+                        help='log every stage as JSON to stderr and print the stage totals')
+    args = parser.parse_args(argv)
+    if not args.profile:
+        args.run(args)
+        return
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format='%(message)s')
+    recorder = use_recorder(StageRecorder(log=True))
+    args.run(args)
+    print(json.dumps(recorder.summary()), file=sys.stderr)
@@ -0,0 +1,241 @@
+"""Columnar (Parquet) store of bead archives, partitioned by folder, date and channel
+(pyarrow is imported on first read)"""
+
+import contextlib
+import functools
+import json
+import os
+import posixpath
+import shutil
+import uuid
+from urllib.parse import quote
+
+import numpy as np
+
+from .datasets import DEFAULT_SPOOL, ChannelData
+from .kernels import CHANNELS
+from .parse import csv_width, is_oversized, iter_csv_chunks, quarantine, read_channels
+from .profiling import timed
+from .schema import SchemaError
+from .workspace import DEFAULT_WORKSPACE
+
+DEFAULT_ROOT = os.path.join(DEFAULT_WORKSPACE, 'columnar')
+MANIFEST = '_manifest.json'
+INDEX = '_index.json'
+
+
+# Dataset over a Parquet store laid out as <root>/<base>/<date>/<channel>.parquet.
+# With a source archive, missing date partitions are converted from it on first
+# access; without one, the store is read-only.
+class ColumnarDataset:
+    def __init__(self, root, source=None):
+        self.root = root
+        self.source = source
+        manifest_path = os.path.join(root, MANIFEST)
+        if source is None:
+            with open(manifest_path) as f:
+                self._manifest = json.load(f)
+            return
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest['fingerprint'] == source.fingerprint and 'fingerprints' in manifest:
+                self._manifest = manifest
+                return
+            if manifest['fingerprint'] != source.fingerprint:
+                shutil.rmtree(root)
+        self._manifest = _build_manifest(source)
+        os.makedirs(root, exist_ok=True)
+        _write_json(manifest_path, self._manifest)
+
+    @property
+    def fingerprint(self):
+        return self._manifest['fingerprint']
+
+    # Same store backed by an on-disk copy of the source archive
+    def spool(self, directory=DEFAULT_SPOOL):
+        if self.source is None:
+            return self
+        return ColumnarDataset(self.root, self.source.spool(directory))
+
+    # Pickled as (root, source) so process pools can reopen the store, with the
+    # manifest's modification time so a store rebuilt after eviction is reopened
+    def __reduce__(self):
+        manifest_path = os.path.join(self.root, MANIFEST)
+        mtime_ns = os.stat(manifest_path).st_mtime_ns if os.path.exists(manifest_path) else None
+        return _reopen_columnar, (self.root, self.source, mtime_ns)
+
+    def list_folders(self, path=''):
+        return list(self._manifest['folders'].get(path, []))
+
+    def list_files(self, path, suffix='.csv'):
+        return [m for m in self._manifest['files'].get(path, []) if m.endswith(suffix)]
+
+    def folder_fingerprint(self, path):
+        return self._manifest['fingerprints'][path]
+
+    def member_size(self, member):
+        return 0 if self.source is None else self.source.member_size(member)
+
+    def open(self, member):
+        if self.source is None:
+            raise KeyError(f'{member}: raw members are not kept in a columnar store')
+        return self.source.open(member)
+
+    # Directory holding the partitions of a date folder
+    def partition_dir(self, path):
+        return os.path.join(self.root, *[quote(part, safe='') for part in path.split('/')])
+
+    # Bead matrix of one channel in a date folder, reading only the requested bead columns
+    def read_channel(self, path, channel, beads=None):
+        import pyarrow.parquet as pq
+
+        directory = self.partition_dir(path)
+        if not os.path.exists(os.path.join(directory, INDEX)):
+            self.ingest(path)
+        with open(os.path.join(directory, INDEX)) as f:
+            index = json.load(f)
+        layout = index['channels'][channel]
+        width = layout['width']
+        columns = np.arange(1, width + 1) if beads is None else np.asarray(beads, dtype=np.int64)
+        names = [f'b{b}' for b in columns if b <= width]
+        table = pq.read_table(os.path.join(directory, f'{channel}.parquet'), columns=names)
+        values = np.full((table.num_rows, len(columns)), np.nan)
+        for j, column in enumerate(table.columns):
+            values[:, j] = column.to_numpy()
+        widths = np.asarray(layout['widths'], dtype=np.int64)
+        if beads is not None:
+            widths = np.searchsorted(columns - 1, widths)
+        return ChannelData(index['files'], np.asarray(layout['offsets'], dtype=np.int64), widths, values)
+
+    # {member: reason} of the files of a date folder left out when it was converted
+    def quarantined(self, path):
+        directory = self.partition_dir(path)
+        if not os.path.exists(os.path.join(directory, INDEX)):
+            self.ingest(path)
+        with open(os.path.join(directory, INDEX)) as f:
+            return json.load(f).get('quarantine', {})
+
+    # Convert one date folder of the source archive into per-channel Parquet files,
+    # one row group per file or, for oversized files, per streamed block
+    @timed('extract')
+    def ingest(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.source is None:
+            raise KeyError(f'{path}: partition missing and no source archive to convert from')
+        directory = self.partition_dir(path)
+        staging = f'{directory}.tmp-{uuid.uuid4().hex}'
+        os.makedirs(staging)
+        members = self.list_files(path, '.csv')
+        # Columns for the widest first line; files narrower than that are NaN-padded
+        schema = pa.schema([(f'b{j + 1}', pa.float64())
+                            for j in range(max((csv_width(self.source, m) - 1 for m in members), default=0))])
+        files = []
+        rejected = {}
+        layout = {c: {'width': 0, 'offsets': [0], 'widths': []} for c in CHANNELS}
+        writers = {c: pq.ParquetWriter(os.path.join(staging, f'{c}.parquet'), schema) for c in CHANNELS}
+        try:
+            for member in members:
+                try:
+                    if is_oversized(self.source, member):
+                        shapes = _stream_member(pa, pq, self.source, member, schema, staging, writers)
+                    else:
+                        parsed = read_channels(self.source, member, cache=None)
+                        shapes = {c: parsed[c].shape for c in CHANNELS}
+                        for channel in CHANNELS:
+                            if len(parsed[channel]):
+                                writers[channel].write_table(_block_table(pa, parsed[channel], schema))
+                except SchemaError as error:
+                    # Members failing the schema checks are left out and recorded with the reason
+                    quarantine(self.source, error, rejected)
+                    continue
+                files.append(member)
+                for channel, (rows, width) in shapes.items():
+                    channel_layout = layout[channel]
+                    channel_layout['offsets'].append(channel_layout['offsets'][-1] + rows)
+                    channel_layout['widths'].append(width)
+                    channel_layout['width'] = max(channel_layout['width'], width)
+        finally:
+            for writer in writers.values():
+                writer.close()
+        _write_json(os.path.join(staging, INDEX), {'files': files, 'quarantine': rejected, 'channels': layout})
+        try:
+            os.replace(staging, directory)
+        except OSError:
+            # Another session converted the same partition first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    # Convert every date folder of the source archive up front
+    def ingest_all(self):
+        for base_folder in self.list_folders():
+            for date_folder in self.list_folders(base_folder):
+                path = posixpath.join(base_folder, date_folder)
+                if not os.path.exists(os.path.join(self.partition_dir(path), INDEX)):
+                    self.ingest(path)
+
+
+# Function to open (and lazily fill) the columnar store of an archive
+def open_columnar(source, root=DEFAULT_ROOT):
+    return ColumnarDataset(os.path.join(root, source.fingerprint), source)
+
+
+# Function to snapshot the folder tree and file lists of a dataset
+def _build_manifest(source):
+    folders = {}
+    files = {}
+    fingerprints = {}
+    for base_folder in source.list_folders():
+        folders.setdefault('', []).append(base_folder)
+        folders[base_folder] = source.list_folders(base_folder)
+        for date_folder in folders[base_folder]:
+            path = posixpath.join(base_folder, date_folder)
+            files[path] = source.list_files(path, '.csv')
+            fingerprints[path] = source.folder_fingerprint(path)
+    return {'fingerprint': source.fingerprint, 'folders': folders, 'files': files, 'fingerprints': fingerprints}
+
+
+# Function to write the blocks of an oversized member to the store, returning
+# {channel: (rows, width)}; blocks go to per-member files first and are only
+# copied over, row group by row group, once the whole member has parsed
+def _stream_member(pa, pq, source, member, schema, staging, writers):
+    paths = {c: os.path.join(staging, f'{c}.member.parquet') for c in CHANNELS}
+    shapes = {c: (0, 0) for c in CHANNELS}
+    try:
+        with contextlib.ExitStack() as stack:
+            member_writers = {c: stack.enter_context(pq.ParquetWriter(paths[c], schema)) for c in CHANNELS}
+            for blocks in iter_csv_chunks(source, member):
+                for channel in CHANNELS:
+                    block = blocks[channel]
+                    shapes[channel] = (shapes[channel][0] + block.shape[0], block.shape[1])
+                    if len(block):
+                        member_writers[channel].write_table(_block_table(pa, block, schema))
+        for channel in CHANNELS:
+            member_file = pq.ParquetFile(paths[channel])
+            for i in range(member_file.num_row_groups):
+                writers[channel].write_table(member_file.read_row_group(i))
+    finally:
+        for member_path in paths.values():
+            if os.path.exists(member_path):
+                os.remove(member_path)
+    return shapes
+
+
+# Function to turn a rows x beads block into a table of the store's schema
+def _block_table(pa, values, schema):
+    columns = [values[:, j] if j < values.shape[1] else np.full(len(values), np.nan) for j in range(len(schema))]
+    return pa.Table.from_arrays([pa.array(column, pa.float64()) for column in columns], schema=schema)
+
+
+# Stores reopened in a worker process are kept for the following tasks
+@functools.lru_cache(maxsize=8)
+def _reopen_columnar(root, source, mtime_ns=None):
+    return ColumnarDataset(root, source)
+
+
+def _write_json(path, obj):
+    staging = f'{path}.tmp-{uuid.uuid4().hex}'
+    with open(staging, 'w') as f:
+        json.dump(obj, f)
+    os.replace(staging, path)
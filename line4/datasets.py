@@ -0,0 +1,297 @@
+"""Datasets for the Line 4 bead apps: the common interface and the archive and directory backends"""
+
+import functools
+import hashlib
+import os
+import posixpath
+import shutil
+import uuid
+import zipfile
+from collections import namedtuple
+from typing import IO, Protocol, runtime_checkable
+
+import numpy as np
+
+from .parse import iter_valid
+from .profiling import timed
+from .workspace import DEFAULT_WORKSPACE
+
+DEFAULT_SPOOL = os.path.join(DEFAULT_WORKSPACE, 'archives')
+
+
+# Bead matrix of one channel in one date folder: the rows of every file stacked
+# (NaN-padded to the widest file), rows offsets[i]:offsets[i + 1] and the first
+# widths[i] beads belonging to files[i]
+class ChannelData(namedtuple('ChannelData', ['files', 'offsets', 'widths', 'values'])):
+    __slots__ = ()
+
+    # Stack per-file matrices, optionally keeping only the given 1-based bead numbers (ascending)
+    @classmethod
+    def stack(cls, files, matrices, beads=None):
+        widths = np.array([m.shape[1] for m in matrices], dtype=np.int64)
+        offsets = np.zeros(len(matrices) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([m.shape[0] for m in matrices])
+        width = int(widths.max()) if len(widths) else 0
+        columns = np.arange(width) if beads is None else np.asarray(beads, dtype=np.int64) - 1
+        values = np.full((offsets[-1], len(columns)), np.nan)
+        for i, m in enumerate(matrices):
+            keep = columns < m.shape[1]
+            values[offsets[i]:offsets[i + 1], keep] = m[:, columns[keep]]
+        if beads is not None:
+            widths = np.searchsorted(columns, widths)
+        return cls(list(files), offsets, widths, values)
+
+    # Bead matrix of the i-th file
+    def file_values(self, i):
+        return self.values[self.offsets[i]:self.offsets[i + 1], :self.widths[i]]
+
+    # Bead matrices of all files, in order
+    def split(self):
+        return [self.file_values(i) for i in range(len(self.files))]
+
+
+# Interface shared by every backend (directory, ZIP, columnar, memory-mapped):
+# folders are '/'-separated paths relative to the root, members are the file
+# names list_files() returns, and read_channel() returns a ChannelData or any
+# object with the same files / split() / file_values() API
+@runtime_checkable
+class Dataset(Protocol):
+    @property
+    def fingerprint(self) -> str: ...
+
+    def list_folders(self, path: str = '') -> list[str]: ...
+
+    def list_files(self, path: str, suffix: str = '.csv') -> list[str]: ...
+
+    def folder_fingerprint(self, path: str) -> str: ...
+
+    def member_size(self, member: str) -> int: ...
+
+    def open(self, member: str) -> IO[bytes]: ...
+
+    def read_channel(self, path: str, channel: str, beads=None) -> ChannelData: ...
+
+
+# Dataset over a ZIP archive: the central directory is indexed once and CSV
+# members are streamed straight from the archive, nothing is extracted to disk
+class ZipDataset:
+    @timed('extract')
+    def __init__(self, source):
+        self.source = source
+        self._zip = zipfile.ZipFile(source, 'r')
+        self._infos = {}
+        self._folders = {'': set()}
+        self._files = {}
+        for info in self._zip.infolist():
+            name = info.filename.rstrip('/')
+            if not name:
+                continue
+            if info.is_dir():
+                self._add_folder(name)
+                continue
+            parent, leaf = posixpath.split(name)
+            self._add_folder(parent)
+            self._files.setdefault(parent, []).append(name)
+            self._infos[name] = info
+        for members in self._files.values():
+            members.sort()
+        self._fingerprint = None
+
+    # Content hash of the archive built from the central directory (names, sizes
+    # and CRC-32s), so it never has to reread the member data
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            for name in sorted(self._infos):
+                info = self._infos[name]
+                digest.update(f'{name}\0{info.file_size}\0{info.CRC:08x}\n'.encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    # Hash of the CSV files of one folder (names, sizes, timestamps and CRC-32s)
+    # that changes whenever a file in it is added, removed or rewritten
+    def folder_fingerprint(self, path):
+        digest = hashlib.blake2b(digest_size=16)
+        for name in self.list_files(path, '.csv'):
+            info = self._infos[name]
+            stamp = '%04d%02d%02d%02d%02d%02d' % info.date_time
+            digest.update(f'{name}\0{info.file_size}\0{stamp}\0{info.CRC:08x}\n'.encode())
+        return digest.hexdigest()
+
+    # Register a folder and all of its parents in the index
+    def _add_folder(self, path):
+        while path:
+            self._folders.setdefault(path, set())
+            parent, leaf = posixpath.split(path)
+            siblings = self._folders.setdefault(parent, set())
+            if leaf in siblings:
+                break
+            siblings.add(leaf)
+            path = parent
+
+    # Sorted sub-folder names of a folder ('' is the archive root)
+    def list_folders(self, path=''):
+        return sorted(self._folders.get(path, ()))
+
+    # Member names of the files directly inside a folder
+    def list_files(self, path, suffix='.csv'):
+        return [m for m in self._files.get(path, ()) if m.endswith(suffix)]
+
+    # Uncompressed size of a member in bytes
+    def member_size(self, member):
+        return self._infos[member].file_size
+
+    # Open a member for streaming reads
+    def open(self, member):
+        return self._zip.open(member, 'r')
+
+    # Bead matrix of one channel across the valid CSV files of a folder
+    def read_channel(self, path, channel, beads=None):
+        parsed = dict(iter_valid(self, self.list_files(path, '.csv')))
+        return ChannelData.stack(list(parsed), [channels[channel] for channels in parsed.values()], beads)
+
+    # On-disk copy of an in-memory archive (written once per fingerprint) that
+    # worker processes can reopen by path; the copy is checked against the
+    # archive before it takes the permanent name
+    @timed('extract')
+    def spool(self, directory=DEFAULT_SPOOL):
+        if isinstance(self.source, (str, os.PathLike)):
+            return self
+        path = os.path.join(directory, f'{self.fingerprint}.zip')
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            staging = f'{path}.tmp-{uuid.uuid4().hex}'
+            try:
+                size = self._copy_source(staging)
+                with ZipDataset(staging) as copy:
+                    matches = os.path.getsize(staging) == size and copy.fingerprint == self.fingerprint
+                if not matches:
+                    raise OSError(f'{staging}: spooled copy does not match the archive')
+                os.replace(staging, path)
+            finally:
+                if os.path.exists(staging):
+                    os.remove(staging)
+        return ZipDataset(path)
+
+    # Write the bytes of an in-memory archive to a file, returning its size.
+    # Readers of open members move the shared file position, so a file object is
+    # copied under the archive's lock; buffers are copied without touching it.
+    def _copy_source(self, path):
+        with open(path, 'wb') as f:
+            if hasattr(self.source, 'getbuffer'):
+                with self.source.getbuffer() as buffer:
+                    f.write(buffer)
+                    return buffer.nbytes
+            with self._zip._lock:
+                position = self.source.tell()
+                try:
+                    self.source.seek(0)
+                    shutil.copyfileobj(self.source, f)
+                    return self.source.tell()
+                finally:
+                    self.source.seek(position)
+
+    # Pickled by path so process pools can reopen the archive; the file's
+    # modification time tells a rewritten spool from the one a worker has open
+    def __reduce__(self):
+        if not isinstance(self.source, (str, os.PathLike)):
+            raise TypeError('in-memory archives cannot be sent to worker processes, spool() them first')
+        return _reopen_zip, (os.fspath(self.source), os.stat(self.source).st_mtime_ns)
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Archives reopened in a worker process are kept open for the following tasks
+@functools.lru_cache(maxsize=8)
+def _reopen_zip(path, mtime_ns=None):
+    return ZipDataset(path)
+
+
+# Dataset over an extracted folder tree (<root>/<base>/<date>/*.csv); the tree is
+# walked once and members are '/'-separated paths relative to the root
+class DirectoryDataset:
+    @timed('list')
+    def __init__(self, root):
+        self.root = os.fspath(root)
+        self._folders = {'': []}
+        self._files = {}
+        self._stats = {}
+        for directory, subdirs, filenames in os.walk(self.root):
+            subdirs.sort()
+            rel = os.path.relpath(directory, self.root).replace(os.sep, '/')
+            path = '' if rel == '.' else rel
+            self._folders[path] = list(subdirs)
+            members = []
+            for filename in sorted(filenames):
+                member = posixpath.join(path, filename)
+                self._stats[member] = os.stat(os.path.join(directory, filename))
+                members.append(member)
+            self._files[path] = members
+        self._fingerprint = None
+
+    # Hash of the tree built from names, sizes and modification times
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            for name in sorted(self._stats):
+                stat = self._stats[name]
+                digest.update(f'{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    # Hash of the CSV files of one folder (names, sizes and modification times)
+    def folder_fingerprint(self, path):
+        digest = hashlib.blake2b(digest_size=16)
+        for name in self.list_files(path, '.csv'):
+            stat = self._stats[name]
+            digest.update(f'{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode())
+        return digest.hexdigest()
+
+    def list_folders(self, path=''):
+        return list(self._folders.get(path, ()))
+
+    def list_files(self, path, suffix='.csv'):
+        return [m for m in self._files.get(path, ()) if m.endswith(suffix)]
+
+    def member_size(self, member):
+        return self._stats[member].st_size
+
+    def open(self, member):
+        return open(os.path.join(self.root, *member.split('/')), 'rb')
+
+    # Bead matrix of one channel across the valid CSV files of a folder
+    def read_channel(self, path, channel, beads=None):
+        parsed = dict(iter_valid(self, self.list_files(path, '.csv')))
+        return ChannelData.stack(list(parsed), [channels[channel] for channels in parsed.values()], beads)
+
+    # Already on disk, worker processes can reopen it as it is
+    def spool(self, directory=DEFAULT_SPOOL):
+        return self
+
+    # Pickled by root so process pools can reopen the tree
+    def __reduce__(self):
+        return _reopen_directory, (self.root,)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Trees reopened in a worker process are kept for the following tasks
+@functools.lru_cache(maxsize=8)
+def _reopen_directory(root):
+    return DirectoryDataset(root)
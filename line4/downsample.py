@@ -0,0 +1,101 @@
+"""Server-side downsampling of long traces and large grids before they are sent to the browser"""
+
+import warnings
+
+import numpy as np
+
+# Traces longer than this are drawn with WebGL (go.Scattergl)
+WEBGL_THRESHOLD = 10000
+
+
+# Function to keep the minimum and maximum of each of n_out // 2 equal buckets,
+# so spikes survive at any zoom level; returns (indices, values)
+def minmax(y, n_out):
+    n = len(y)
+    buckets = max(n_out // 2, 1)
+    if n <= n_out:
+        return np.arange(n), y
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    missing = np.isnan(padded)
+    lo = np.where(missing, np.inf, padded).argmin(axis=1)
+    hi = np.where(missing, -np.inf, padded).argmax(axis=1)
+    base = np.arange(buckets) * size
+    indices = np.sort(np.concatenate([base + lo, base + hi]))
+    indices = np.unique(indices[indices < n])
+    return indices, y[indices]
+
+
+# Function to pick n_out points with Largest-Triangle-Three-Buckets, which keeps
+# the visual shape of the line; returns (indices, values)
+def lttb(y, n_out):
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n), y
+    filled = np.where(np.isnan(y), np.nanmean(y) if np.isfinite(y).any() else 0.0, y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = (stop + next_stop - 1) / 2
+        next_y = filled[stop:next_stop].mean() if next_stop > stop else filled[-1]
+        x = np.arange(start, stop)
+        area = np.abs((a - next_x) * (filled[start:stop] - filled[a]) - (a - x) * (next_y - filled[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices, y[indices]
+
+
+METHODS = {'minmax': minmax, 'lttb': lttb}
+
+
+# Function to reduce y[start:stop] to about n_out points; returns (x, y) where x
+# holds the original measurement indices
+def downsample(y, n_out, method='minmax', start=0, stop=None):
+    stop = len(y) if stop is None else min(stop, len(y))
+    start = min(max(start, 0), stop)
+    # Slice before converting so only the window of a memory-mapped trace is read
+    indices, values = METHODS[method](np.asarray(y[start:stop], dtype='float64'), n_out)
+    return indices + start, values
+
+
+GRID_METHODS = ('mean', 'extreme')
+
+
+# Function to reduce a 2D grid to at most max_rows x max_cols cells by pooling
+# equal blocks: 'mean' averages each block, 'extreme' keeps its value farthest
+# from the grid median so isolated hot or cold cells survive. NaN cells are
+# skipped. Returns (row_starts, col_starts, reduced) with the first grid index
+# of each block and the reduced float32 grid
+def downsample_grid(grid, max_rows, max_cols, method='mean'):
+    rows, cols = grid.shape
+    row_step = max(-(-rows // max(max_rows, 1)), 1)
+    col_step = max(-(-cols // max(max_cols, 1)), 1)
+    # An empty grid has no blocks to pool
+    if grid.size == 0 or (row_step == 1 and col_step == 1):
+        return np.arange(rows), np.arange(cols), np.asarray(grid, dtype=np.float32)
+    out_rows, out_cols = -(-rows // row_step), -(-cols // col_step)
+    padded = np.full((out_rows * row_step, out_cols * col_step), np.nan, dtype=np.float32)
+    padded[:rows, :cols] = grid
+    blocks = padded.reshape(out_rows, row_step, out_cols, col_step).transpose(0, 2, 1, 3)
+    blocks = blocks.reshape(out_rows, out_cols, -1)
+    present = ~np.isnan(blocks)
+    if method == 'mean':
+        count = present.sum(axis=-1)
+        total = np.where(present, blocks, 0).sum(axis=-1, dtype='float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            reduced = np.where(count > 0, total / count, np.nan)
+    elif method == 'extreme':
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN grid
+            center = np.nanmedian(grid)
+        deviation = np.where(present, np.abs(blocks - center), -1)
+        reduced = np.take_along_axis(blocks, deviation.argmax(axis=-1)[..., None], axis=-1)[..., 0]
+    else:
+        raise ValueError(f'unknown grid method {method!r}, expected one of {GRID_METHODS}')
+    return np.arange(out_rows) * row_step, np.arange(out_cols) * col_step, reduced.astype(np.float32)
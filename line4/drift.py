@@ -0,0 +1,203 @@
+"""Drift and anomaly detection over the per-date aggregates (scikit-learn is imported on first use)
+
+Works on the aggregated statistics only, never on raw rows: the per-date bead
+moments of every folder are stacked into (folder, date, bead) arrays and scored
+in one batch, so years of daily data take well under a second per channel.
+Each (folder, date) point of a channel can be flagged by
+
+    rules      Western Electric control-chart rules on the mean and std series
+    zscore     robust z-scores (median and MAD over dates) of the pooled mean and
+               std, and the share of beads whose own mean is an outlier
+    isolation  an IsolationForest over those z-scores, fitted on all folders at once
+"""
+
+import warnings
+
+import numpy as np
+
+from .kernels import moments_std
+from .profiling import timed
+
+DETECTORS = {'rules': 'Control-chart rules', 'zscore': 'Robust z-score', 'isolation': 'Isolation forest'}
+DEFAULT_DETECTORS = ('rules', 'zscore')
+
+# Modified z-score beyond which a value is an outlier (Iglewicz and Hoaglin)
+Z_THRESHOLD = 3.5
+# Share of beads that must be outliers for a point to be flagged on bead level
+BEAD_FRACTION = 0.1
+# Expected share of anomalous points for the IsolationForest
+CONTAMINATION = 0.01
+# Series shorter than this have no baseline and are never flagged
+MIN_DATES = 8
+
+# Control-chart rules as bits of the rule mask
+RULES = {1: 'beyond 3σ', 2: '2 of 3 beyond 2σ', 4: '4 of 5 beyond 1σ', 8: '8 in a row on one side'}
+
+
+# Function to stack the per-date bead statistics of a channel on one sorted date
+# index; data maps folder -> channel -> date -> RunningStats (as iter_folder_stats
+# yields them). Returns (dates, folders, count, mean, m2), the arrays shaped
+# (folders, dates, beads) with zero counts where a folder has no data
+def stack_stats(data, channel):
+    folders = list(data)
+    columns = [data[folder].get(channel, {}) for folder in folders]
+    dates = sorted(set().union(*columns))
+    position = {date: j for j, date in enumerate(dates)}
+    beads = max((np.atleast_1d(stats.count).shape[0] for column in columns for stats in column.values()), default=0)
+    count = np.zeros((len(folders), len(dates), beads), dtype=np.int64)
+    mean = np.zeros(count.shape)
+    m2 = np.zeros(count.shape)
+    for i, column in enumerate(columns):
+        for date, stats in column.items():
+            j, width = position[date], np.atleast_1d(stats.count).shape[0]
+            count[i, j, :width] = stats.count
+            mean[i, j, :width] = stats.mean_
+            m2[i, j, :width] = stats.m2
+    return np.array(dates, dtype=object), folders, count, mean, m2
+
+
+# Function to pool the beads of stacked moments into one mean and std per point,
+# the same figures date_moments() draws
+def pooled_moments(count, mean, m2):
+    total = count.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pooled_mean = (count * mean).sum(axis=-1) / total
+    pooled_m2 = m2.sum(axis=-1) + (count * (mean - np.nan_to_num(pooled_mean)[..., None]) ** 2).sum(axis=-1)
+    return np.where(total > 0, pooled_mean, np.nan), moments_std(total, pooled_m2)
+
+
+# Function to compute modified z-scores along an axis: deviation from the median
+# in units of 1.4826 MAD (the mean absolute deviation when the MAD is 0); NaN
+# stays NaN and so does every value of a series without spread
+def robust_z(values, axis=1):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN series
+        median = np.nanmedian(values, axis=axis, keepdims=True)
+        deviation = np.abs(values - median)
+        mad = np.nanmedian(deviation, axis=axis, keepdims=True)
+        meanad = np.nanmean(deviation, axis=axis, keepdims=True)
+    scale = np.where(mad > 0, 1.4826 * mad, 1.2533 * meanad)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(scale > 0, (values - median) / scale, np.nan)
+
+
+# Function to mark the last point of every window of n points with at least k hits
+# along the last axis, when that point is a hit itself
+def _runs(hits, k, n):
+    counts = np.cumsum(hits, axis=-1, dtype=np.int32)
+    window = counts.copy()
+    window[..., n:] -= counts[..., :-n]
+    return hits & (window >= k)
+
+
+# Function to apply the Western Electric rules to z-scores along the date axis;
+# returns a mask of RULES bits per point (missing points never count as hits)
+def control_rules(z, axis=1):
+    z = np.moveaxis(z, axis, -1)
+    flags = np.where(np.abs(z) > 3, 1, 0).astype(np.int8)
+    flags |= np.where(_runs(z > 2, 2, 3) | _runs(z < -2, 2, 3), 2, 0).astype(np.int8)
+    flags |= np.where(_runs(z > 1, 4, 5) | _runs(z < -1, 4, 5), 4, 0).astype(np.int8)
+    flags |= np.where(_runs(z > 0, 8, 8) | _runs(z < 0, 8, 8), 8, 0).astype(np.int8)
+    return np.moveaxis(flags, -1, axis)
+
+
+# Function to score points with an IsolationForest; features is (points, features)
+# with NaN rows skipped. Returns a boolean outlier mask, or all False when there
+# are too few points to fit
+def isolation_outliers(features, contamination=CONTAMINATION, seed=0):
+    outliers = np.zeros(len(features), dtype=bool)
+    present = ~np.isnan(features).any(axis=1)
+    if present.sum() < MIN_DATES:
+        return outliers
+    from sklearn.ensemble import IsolationForest
+
+    forest = IsolationForest(contamination=contamination, random_state=seed)
+    outliers[present] = forest.fit_predict(features[present]) == -1
+    return outliers
+
+
+# Flags of one channel: every array is shaped (folders, dates); bead_outliers counts
+# the beads of a point whose mean is an outlier within their own series
+class DriftReport:
+    def __init__(self, channel, dates, folders, mean, std, z_mean, z_std, rules_mean, rules_std,
+                 bead_outliers, beads, isolation, z_threshold=Z_THRESHOLD):
+        self.channel = channel
+        self.dates = dates
+        self.folders = folders
+        self.mean = mean
+        self.std = std
+        self.z_mean = z_mean
+        self.z_std = z_std
+        self.rules_mean = rules_mean
+        self.rules_std = rules_std
+        self.bead_outliers = bead_outliers
+        self.beads = beads
+        self.isolation = isolation
+        self.z_threshold = z_threshold
+        self.beads_flagged = bead_outliers >= np.maximum(BEAD_FRACTION * beads, 1)
+
+    # Points flagged on the mean and on the std series
+    @property
+    def flagged_mean(self):
+        return ((self.rules_mean > 0) | (np.abs(self.z_mean) > self.z_threshold) | self.beads_flagged
+                | self.isolation)
+
+    @property
+    def flagged_std(self):
+        return (self.rules_std > 0) | (np.abs(self.z_std) > self.z_threshold)
+
+    # Why a point was flagged, as one line of text
+    def reason(self, i, j):
+        reasons = []
+        for label, rules, z in (('mean', self.rules_mean[i, j], self.z_mean[i, j]),
+                                ('std', self.rules_std[i, j], self.z_std[i, j])):
+            reasons.extend(f'{label} {text}' for bit, text in RULES.items() if rules & bit)
+            if abs(z) > self.z_threshold:
+                reasons.append(f'{label} z={z:+.1f}')
+        if self.beads_flagged[i, j]:
+            reasons.append(f'{self.bead_outliers[i, j]} of {self.beads[i, j]} beads off their level')
+        if self.isolation[i, j]:
+            reasons.append('isolated by the forest')
+        return ', '.join(reasons)
+
+    # Flagged points as (folder, date, field, reason) with field 0 for the mean
+    # and 1 for the std, ready to overlay on the date_std figures
+    def anomalies(self):
+        points = []
+        for field, flagged in enumerate((self.flagged_mean, self.flagged_std)):
+            for i, j in zip(*np.nonzero(flagged)):
+                points.append((self.folders[i], self.dates[j], field, self.reason(i, j)))
+        return points
+
+
+# Function to score every (folder, date) point of a channel in one batch with the
+# chosen detectors; data maps folder -> channel -> date -> RunningStats
+@timed('detect')
+def detect_drift(data, channel, detectors=DEFAULT_DETECTORS, contamination=CONTAMINATION):
+    dates, folders, count, mean, m2 = stack_stats(data, channel)
+    bead_mean = np.where(count > 0, mean, np.nan)
+    mean, std = pooled_moments(count, mean, m2)
+    shape = mean.shape
+    short = np.isnan(mean).sum(axis=1, keepdims=True) > shape[1] - MIN_DATES
+
+    z_mean = np.where(short, np.nan, robust_z(mean))
+    z_std = np.where(short, np.nan, robust_z(std))
+    rules_mean = control_rules(z_mean) if 'rules' in detectors else np.zeros(shape, np.int8)
+    rules_std = control_rules(z_std) if 'rules' in detectors else np.zeros(shape, np.int8)
+
+    beads = (count > 0).sum(axis=-1)
+    bead_z = robust_z(bead_mean)
+    bead_outliers = np.where(short, 0, (np.abs(np.nan_to_num(bead_z)) > Z_THRESHOLD).sum(axis=-1))
+    isolation = np.zeros(shape, dtype=bool)
+    if 'isolation' in detectors:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bead_share = bead_outliers / beads
+        features = np.stack([z_mean, z_std, bead_share], axis=-1).reshape(-1, 3)
+        isolation = isolation_outliers(features, contamination).reshape(shape)
+    z_threshold = Z_THRESHOLD
+    if 'zscore' not in detectors:
+        # z-scores still feed the rules and the forest, they just flag nothing themselves
+        z_threshold = np.inf
+        bead_outliers = np.zeros(shape, np.int64)
+    return DriftReport(channel, dates, folders, mean, std, z_mean, z_std, rules_mean, rules_std,
+                       bead_outliers, beads, isolation, z_threshold)
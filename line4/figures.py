@@ -0,0 +1,279 @@
+"""Plotly figures of the six views (plotly is imported on first use, so the
+engine stays importable headless); numeric data goes out as 32-bit typed arrays"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .downsample import WEBGL_THRESHOLD, downsample, downsample_grid
+from .profiling import timed
+
+# Display names of the channels
+CHANNEL_TITLES = {'Ch01': 'NIR', 'Ch02': 'VIS', 'Ch03': 'LO'}
+
+# Figures kept for identical aligned data (per process, least recently used first out)
+FIGURE_CACHE_SIZE = 64
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+
+
+# Function to draw the raw traces of a channel, each reduced to max_points within
+# the selected window (% of the trace)
+@timed('plot')
+def trace_figure(channel_data, identifier, max_points, method='minmax', window=(0, 100)):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    for values in channel_data.split():
+        values = values.reshape(-1)
+        start, stop = (len(values) * percent // 100 for percent in window)
+        x, y = downsample(values, max_points, method, start, stop)
+        scatter = go.Scattergl if len(values) > WEBGL_THRESHOLD else go.Scatter
+        # 32-bit typed arrays halve the serialized payload of every trace
+        fig.add_trace(scatter(x=x.astype(np.int32), y=y.astype(np.float32), mode='lines', name=identifier))
+
+    fig.update_layout(
+        title=f'{identifier} Bead Data',
+        xaxis_title='Measurement',
+        yaxis_title='Value'
+    )
+    return fig
+
+
+# Function to draw the mean of each bead number, one line per file, from per-file
+# bead moments (BeadMoments); show_average adds the files merged bead by bead
+@timed('plot')
+def bead_mean_figure(moments, identifier, show_average=False):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    for stats in moments.split():
+        means = stats.mean
+        bead_numbers = np.arange(1, len(means) + 1, dtype=np.int32)
+        fig.add_trace(go.Scatter(x=bead_numbers, y=means.astype(np.float32), mode='lines+markers',
+                                 name=f'{identifier} Mean'))
+    if show_average and len(moments.files):
+        means = np.atleast_1d(moments.combined().mean)
+        fig.add_trace(go.Scatter(x=np.arange(1, len(means) + 1, dtype=np.int32), y=means.astype(np.float32),
+                                 mode='lines', name=f'{identifier} Average across files',
+                                 line=dict(color='black', width=3, dash='dash')))
+
+    fig.update_layout(
+        title=f'{identifier} Bead Data (Averaged)',
+        xaxis_title='Bead Number',
+        yaxis_title='Average Value'
+    )
+    return fig
+
+
+# Function to draw the pooled bead averages of a channel against the date folders
+@timed('plot')
+def date_average_figure(averages, identifier, date_folders):
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=date_folders, y=np.asarray(averages, dtype=np.float32), mode='lines+markers',
+                             name=f'{identifier} Average'))
+
+    fig.update_layout(
+        title=f'{identifier} Bead Data (Averaged by Date)',
+        xaxis_title='Date',
+        yaxis_title='Average Value'
+    )
+    return fig
+
+
+# Function to draw a date x bead grid of a channel (date_bead_means) as a heatmap,
+# pooled server-side into at most max_dates x max_beads cells; beads=(first, last)
+# bead numbers zooms into part of the weld before pooling
+@timed('plot')
+def bead_heatmap_figure(dates, grid, identifier, max_dates=400, max_beads=400, method='mean', beads=None):
+    first = 0
+    if beads is not None:
+        first = beads[0] - 1
+        grid = grid[:, first:beads[1]]
+    rows, cols, values = downsample_grid(grid, max_dates, max_beads, method)
+    # Each cell is labelled with the first date and bead number it pools
+    row_dates = dates[rows]
+
+    def build():
+        import plotly.graph_objects as go
+
+        title = CHANNEL_TITLES.get(identifier, identifier)
+        fig = go.Figure(go.Heatmap(z=values, x=(cols + first + 1).astype(np.int32), y=row_dates,
+                                   colorscale='Viridis', colorbar=dict(title='Mean'), hoverongaps=False))
+        fig.update_layout(
+            title=f'{title} Bead Mean by Date and Bead',
+            xaxis_title='Bead Number',
+            yaxis_title='Date'
+        )
+        return fig
+
+    return _cached_figure('bead_heatmap', identifier, row_dates, [method, first], values, build)
+
+
+# Function to align the per-date values of every folder on one sorted date index;
+# data_dict maps folder -> channel -> date -> value (or a tuple of fields values).
+# Returns (dates, folders, values) with values[folder, date, field] as float32 and
+# NaN where a folder has no data for a date, which plotly draws as a gap
+def align_dates(data_dict, identifier, fields=1):
+    folders = list(data_dict)
+    columns = [data_dict[folder].get(identifier, {}) for folder in folders]
+    dates = sorted(set().union(*columns))
+    position = {date: i for i, date in enumerate(dates)}
+    # One object array shared by every trace (plotly copies arrays without re-validating each date)
+    dates = np.array(dates, dtype=object)
+    values = np.full((len(folders), len(dates), fields), np.nan, dtype=np.float32)
+    for i, column in enumerate(columns):
+        if column:
+            index = np.fromiter((position[date] for date in column), np.int64, len(column))
+            values[i, index] = np.array(list(column.values()), dtype=np.float64).reshape(len(column), fields)
+    return dates, folders, values
+
+
+# Function to return the figure of a builder for aligned data from the cache,
+# building it on a miss; the key is a hash of the aligned values, so reruns
+# triggered by unrelated widgets reuse the figure (callers must not modify it)
+def _cached_figure(builder, identifier, dates, folders, values, build, anomalies=None):
+    digest = hashlib.blake2b(values.tobytes(), digest_size=16)
+    digest.update('\0'.join(map(str, dates)).encode())
+    digest.update('\0'.join(map(str, folders)).encode())
+    digest.update(repr(anomalies).encode())
+    key = (builder, identifier, values.shape, digest.hexdigest())
+    with _figures_lock:
+        fig = _figures.get(key)
+        if fig is not None:
+            _figures.move_to_end(key)
+            return fig
+    fig = build()
+    with _figures_lock:
+        _figures[key] = fig
+        while len(_figures) > FIGURE_CACHE_SIZE:
+            _figures.popitem(last=False)
+    return fig
+
+
+# Function to build the overlay of flagged points (DriftReport.anomalies()) on
+# aligned mean/std data: one red marker trace per field, the reason as hover text
+def _anomaly_traces(anomalies, dates, folders, values):
+    import plotly.graph_objects as go
+
+    date_index = {date: j for j, date in enumerate(dates)}
+    folder_index = {folder: i for i, folder in enumerate(folders)}
+    traces = {}
+    for folder, date, field, reason in anomalies or ():
+        if folder in folder_index and date in date_index:
+            trace = traces.setdefault(field, ([], [], []))
+            trace[0].append(date)
+            trace[1].append(values[folder_index[folder], date_index[date], field])
+            trace[2].append(f'{folder}: {reason}')
+    return [(field, go.Scattergl(x=x, y=np.asarray(y, dtype=np.float32), mode='markers', hovertext=text,
+                                 name='Flagged ' + ('mean' if field == 0 else 'std dev'),
+                                 marker=dict(color='red', symbol='x', size=10)))
+            for field, (x, y, text) in sorted(traces.items())]
+
+
+# Function to draw the mean by date of a channel, one WebGL line per folder;
+# data_dict maps folder -> channel -> date -> mean
+@timed('plot')
+def date_mean_figure(data_dict, identifier):
+    dates, folders, values = align_dates(data_dict, identifier)
+
+    def build():
+        import plotly.graph_objects as go
+
+        fig = go.Figure()
+        fig.add_traces([go.Scattergl(x=dates, y=values[i, :, 0], mode='lines+markers',
+                                     name=f'{identifier} - {folder_name}')
+                        for i, folder_name in enumerate(folders)])
+
+        title = CHANNEL_TITLES.get(identifier, identifier)
+        fig.update_layout(
+            title=f'{title} Bead Data (Averaged by Date)',
+            xaxis_title='Date',
+            yaxis_title='Average Value'
+        )
+        return fig
+
+    return _cached_figure('date_mean', identifier, dates, folders, values, build)
+
+
+# Function to draw mean (left axis) and dashed standard deviation (right axis) by
+# date, one WebGL pair per folder; data_dict maps folder -> channel -> date -> (mean, std).
+# anomalies are (folder, date, field, reason) points to mark, as DriftReport.anomalies() lists them
+@timed('plot')
+def date_std_figure(data_dict, identifier, anomalies=None):
+    dates, folders, values = align_dates(data_dict, identifier, fields=2)
+
+    def build():
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+        traces, secondary = [], []
+        for i, folder_name in enumerate(folders):
+            traces.append(go.Scattergl(x=dates, y=values[i, :, 0], mode='lines+markers',
+                                       name=f'{identifier} Mean - {folder_name}'))
+            traces.append(go.Scattergl(x=dates, y=values[i, :, 1], mode='lines+markers',
+                                       name=f'{identifier} Std Dev - {folder_name}', line=dict(dash='dash')))
+            secondary.extend([False, True])
+        for field, trace in _anomaly_traces(anomalies, dates, folders, values):
+            traces.append(trace)
+            secondary.append(field == 1)
+        # Added in one batch: add_trace re-lays out the subplot grid on every call
+        fig.add_traces(traces, rows=[1] * len(traces), cols=[1] * len(traces), secondary_ys=secondary)
+
+        fig.update_layout(
+            title=f'{identifier} Bead Data (Averaged by Date)',
+            xaxis_title='Date',
+            yaxis_title='Mean Value',
+            yaxis2_title='Standard Deviation',
+            legend_title='Legend'
+        )
+        return fig
+
+    return _cached_figure('date_std', identifier, dates, folders, values, build, anomalies)
+
+
+# Function to draw mean and standard deviation by date in two stacked subplots,
+# one colour per folder and WebGL traces; data_dict maps folder -> channel -> date -> (mean, std)
+# and anomalies are flagged points to mark, as for date_std_figure
+@timed('plot')
+def date_std_subplots(data_dict, identifier, anomalies=None):
+    dates, folders, values = align_dates(data_dict, identifier, fields=2)
+
+    def build():
+        import plotly.express as px
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
+
+        color_scale = px.colors.qualitative.Plotly
+        title = CHANNEL_TITLES.get(identifier, identifier)
+
+        fig = make_subplots(rows=2, cols=1, subplot_titles=(f'{title} Mean', f'{title} Standard Deviation'))
+        traces, rows = [], []
+        for i, folder_name in enumerate(folders):
+            traces.append(go.Scattergl(x=dates, y=values[i, :, 0], mode='lines+markers', name=f'Mean - {folder_name}',
+                                       line=dict(color=color_scale[i % len(color_scale)])))
+            traces.append(go.Scattergl(x=dates, y=values[i, :, 1], mode='lines+markers',
+                                       name=f'Std Dev - {folder_name}'))
+            rows.extend([1, 2])
+        for field, trace in _anomaly_traces(anomalies, dates, folders, values):
+            traces.append(trace)
+            rows.append(field + 1)
+        fig.add_traces(traces, rows=rows, cols=[1] * len(traces))
+
+        fig.update_layout(
+            title=f'{title} Bead Data (Averaged by Date)',
+            xaxis_title='Date',
+            yaxis_title='Value',
+            legend_title='Legend',
+            height=1000
+        )
+        fig.update_yaxes(title_text='Mean Value', row=1, col=1)
+        fig.update_yaxes(title_text='Standard Deviation', row=2, col=1)
+        return fig
+
+    return _cached_figure('date_std_subplots', identifier, dates, folders, values, build, anomalies)
@@ -0,0 +1,33 @@
+"""Vectorized channel split and per-bead reductions"""
+
+import numpy as np
+
+CHANNELS = ['Ch01', 'Ch02', 'Ch03']
+
+
+# Function to split rows by precomputed channel codes (index into channels, or
+# len(channels) for rows to drop)
+def split_codes(codes, values, channels=CHANNELS):
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(channels) + 1))
+    grouped = values[order]
+    return {identifier: grouped[bounds[i]:bounds[i + 1]] for i, identifier in enumerate(channels)}
+
+
+# Function to compute per-bead count, mean and sum of squared deviations (M2)
+# of a rows x beads matrix in one sweep, skipping NaN like pandas does
+def bead_moments(values):
+    present = ~np.isnan(values)
+    count = present.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(present, values, 0.0).sum(axis=0) / count
+        deviation = np.where(present, values - mean, 0.0)
+    m2 = np.einsum('ij,ij->j', deviation, deviation)
+    return count, mean, m2
+
+
+# Function to turn moments into a sample standard deviation (ddof=1, NaN below two rows)
+def moments_std(count, m2):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+
@@ -0,0 +1,177 @@
+"""Asynchronous loading of a plan: member reads overlap with parsing, folders are
+streamed back as they complete, and an abandoned load cancels its pending work"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import posixpath
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .kernels import CHANNELS
+from .parallel import DEFAULT_WORKERS, date_stats, read_date, submit
+from .parse import folder_quarantine, restore_quarantine
+from .profiling import stage
+from .query import group_partitions
+
+# Date folders in flight per worker: one being aggregated while the next is read
+PREFETCH = 2
+
+# Seconds between progress callbacks while waiting for a folder
+HEARTBEAT = 0.25
+
+
+# Async generator over a plan yielding (folder, {channel: {date: RunningStats}})
+# in completion order. With workers > 1 each date folder goes through date_stats
+# in the process pool (the workers read the files from the spooled dataset
+# themselves); otherwise a read thread of this load reads the next date
+# (read_date) while its parse thread folds the current one, so at most workers *
+# PREFETCH dates are in flight. Every date is timed as one 'aggregate' stage,
+# store hits included. on_date(done, total) is called as each date folder
+# finishes. Closing the generator cancels the rest.
+async def aiter_folder_stats(dataset, partitions, workers=DEFAULT_WORKERS, store=None, on_date=None):
+    loop = asyncio.get_running_loop()
+    folders = group_partitions(partitions)
+    total = sum(len(dates) for dates, _ in folders.values())
+    limit = asyncio.Semaphore(max(workers, 1) * PREFETCH)
+    done = 0
+    read_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='line4-read')
+    parse_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='line4-parse')
+
+    # Threads keep the caller's profiling context; worker processes start fresh
+    def run(executor, fn, *args):
+        context = contextvars.copy_context()
+        return loop.run_in_executor(executor, functools.partial(context.run, fn, *args))
+
+    async def load_date(path):
+        nonlocal done
+        folder, date = posixpath.split(path)
+        with stage('aggregate', folder=folder, date=date):
+            partial = fingerprint = None
+            if store is not None:
+                fingerprint = dataset.folder_fingerprint(path)
+                partial = store.get(path, fingerprint)
+                if partial is not None:
+                    restore_quarantine(dataset, store.rejected(path, fingerprint))
+            if partial is None:
+                async with limit:
+                    if workers > 1:
+                        partial = await asyncio.wrap_future(submit(workers, date_stats, dataset, path))
+                    else:
+                        data = await run(read_thread, read_date, dataset, path)
+                        partial = await run(parse_thread, date_stats, dataset, path, CHANNELS, data)
+                if store is not None:
+                    store.put(path, fingerprint, partial, folder_quarantine(dataset, path))
+        done += 1
+        if on_date is not None:
+            on_date(done, total)
+        return partial
+
+    async def load_folder(folder, dates, channels):
+        partials = await asyncio.gather(*(load_date(posixpath.join(folder, date)) for date in dates))
+        return folder, {channel: {date: p[channel] for date, p in zip(dates, partials)} for channel in channels}
+
+    tasks = [asyncio.ensure_future(load_folder(folder, dates, channels))
+             for folder, (dates, channels) in folders.items()]
+    try:
+        for completed in asyncio.as_completed(tasks):
+            yield await completed
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        read_thread.shutdown(wait=False, cancel_futures=True)
+        parse_thread.shutdown(wait=False, cancel_futures=True)
+
+
+_DONE = object()
+
+
+class _Progress:
+    __slots__ = ('done', 'total')
+
+    def __init__(self, done, total):
+        self.done = done
+        self.total = total
+
+
+class _Failed:
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+# Function to run the event loop of a background load until it finishes or is cancelled
+def _run_loop(loop, task):
+    try:
+        loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
+
+
+# Function to import the parsing libraries on the calling thread: a module first
+# imported from two threads at once (the loader and a Streamlit script drawing a
+# chart) can be handed out half initialized
+def _preload():
+    import pandas  # noqa: F401
+
+    with contextlib.suppress(ImportError):
+        import pyarrow.parquet  # noqa: F401
+
+
+# Function to run aiter_folder_stats on a background event loop and yield its
+# folders in the calling thread as they complete. on_progress(done, total) is
+# called from the calling thread after every date folder and every HEARTBEAT
+# seconds while waiting, so a Streamlit progress bar both shows the load and lets
+# a widget change stop the script; closing the generator (or the exception that
+# stops the script) cancels the dates that have not started yet.
+def stream_folder_stats(dataset, partitions, workers=DEFAULT_WORKERS, store=None, on_progress=None):
+    _preload()
+    results = queue.Queue()
+    loop = asyncio.new_event_loop()
+
+    async def pump():
+        try:
+            loader = aiter_folder_stats(dataset, partitions, workers, store,
+                                        on_date=lambda done, total: results.put(_Progress(done, total)))
+            async with contextlib.aclosing(loader):
+                async for item in loader:
+                    results.put(item)
+        except Exception as error:
+            results.put(_Failed(error))
+        finally:
+            results.put(_DONE)
+
+    task = loop.create_task(pump())
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(_run_loop, loop, task),
+                              name='line4-loader', daemon=True)
+    thread.start()
+    progress = _Progress(0, sum(len(dates) for dates, _ in group_partitions(partitions).values()))
+    try:
+        while True:
+            try:
+                item = results.get(timeout=HEARTBEAT)
+            except queue.Empty:
+                item = progress
+            if item is _DONE:
+                break
+            if isinstance(item, _Failed):
+                raise item.error
+            if isinstance(item, _Progress):
+                progress = item
+                if on_progress is not None:
+                    on_progress(item.done, item.total)
+                continue
+            yield item
+    finally:
+        if thread.is_alive():
+            with contextlib.suppress(RuntimeError):  # the loop closed in the meantime
+                loop.call_soon_threadsafe(task.cancel)
+        thread.join()
@@ -0,0 +1,240 @@
+"""Memory-mapped float32 bead matrices for random access to single files and beads"""
+
+import json
+import os
+import shutil
+import uuid
+from urllib.parse import quote
+
+import numpy as np
+
+from .datasets import ChannelData
+from .kernels import CHANNELS
+from .parse import is_oversized, iter_csv_chunks, quarantine, read_channels
+from .profiling import timed
+from .schema import SchemaError
+from .stats import RunningStats
+from .workspace import DEFAULT_WORKSPACE
+
+DEFAULT_ROOT = os.path.join(DEFAULT_WORKSPACE, 'memmap')
+INDEX = '_index.json'
+MOMENTS = '.moments.npz'
+
+
+# Bead matrices of one channel in one date folder, backed by a flat float32 file:
+# file i occupies values[starts[i]:starts[i] + rows[i] * widths[i]] in row-major
+# order, so slicing a file or a bead only pages in the bytes it needs
+class BeadMatrix:
+    def __init__(self, files, starts, rows, widths, values):
+        self.files = files
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.widths = np.asarray(widths, dtype=np.int64)
+        self.values = values
+
+    # Open the matrix of one channel from a date partition directory
+    @classmethod
+    def open(cls, directory, channel):
+        with open(os.path.join(directory, INDEX)) as f:
+            layout = json.load(f)
+        channel_layout = layout['channels'][channel]
+        path = os.path.join(directory, f'{channel}.f32')
+        if os.path.getsize(path):
+            values = np.memmap(path, dtype=np.float32, mode='r')
+        else:
+            values = np.zeros(0, dtype=np.float32)
+        return cls(layout['files'], channel_layout['starts'], channel_layout['rows'], channel_layout['widths'], values)
+
+    # Bead matrix of the i-th file (a view into the mapping, nothing is read yet)
+    def file_values(self, i):
+        start = self.starts[i]
+        return self.values[start:start + self.rows[i] * self.widths[i]].reshape(self.rows[i], self.widths[i])
+
+    # Bead matrices of all files, in order
+    def split(self):
+        return [self.file_values(i) for i in range(len(self.files))]
+
+
+# Per-file bead moments of one channel in one date folder: count, mean and M2 of
+# every bead of every file, file i at offsets[i]:offsets[i + 1]. Stored next to
+# the memory-mapped matrices so bead-mean views never touch the raw values.
+class BeadMoments:
+    def __init__(self, files, offsets, count, mean, m2):
+        self.files = files
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    # Moments of a list of per-file RunningStats (a file without rows counts as width 0)
+    @classmethod
+    def from_stats(cls, files, stats):
+        parts = [(s.count, s.mean_, s.m2) if s.count.ndim else (np.zeros(0, np.int64), np.zeros(0), np.zeros(0))
+                 for s in stats]
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(count) for count, _, _ in parts])
+        if not parts:
+            return cls(list(files), offsets, np.zeros(0, np.int64), np.zeros(0), np.zeros(0))
+        count, mean, m2 = (np.concatenate(column) for column in zip(*parts))
+        return cls(list(files), offsets, count.astype(np.int64), mean.astype('float64'), m2.astype('float64'))
+
+    # Open the moments of one channel from a date partition directory (None if not recorded)
+    @classmethod
+    def open(cls, directory, channel):
+        path = os.path.join(directory, f'{channel}{MOMENTS}')
+        if not os.path.exists(path):
+            return None
+        with open(os.path.join(directory, INDEX)) as f:
+            files = json.load(f)['files']
+        with np.load(path) as arrays:
+            return cls(files, arrays['offsets'], arrays['count'], arrays['mean'], arrays['m2'])
+
+    def save(self, directory, channel):
+        path = os.path.join(directory, f'{channel}{MOMENTS}')
+        staging = f'{path}.tmp-{uuid.uuid4().hex}'
+        with open(staging, 'wb') as f:
+            np.savez(f, offsets=self.offsets, count=self.count, mean=self.mean, m2=self.m2)
+        os.replace(staging, path)
+
+    # Accumulator of the i-th file
+    def file_stats(self, i):
+        start, stop = self.offsets[i], self.offsets[i + 1]
+        return RunningStats(self.count[start:stop], self.mean[start:stop], self.m2[start:stop])
+
+    # Accumulators of all files, in order
+    def split(self):
+        return [self.file_stats(i) for i in range(len(self.files))]
+
+    # All files merged bead by bead (the average across files)
+    def combined(self):
+        return RunningStats.combine(self.split())
+
+
+# Dataset wrapper that serves read_channel() from memory-mapped partitions under
+# <root>/<base>/<date>/, converting a date folder from the wrapped dataset one
+# CSV at a time on first access so memory stays bounded by the largest file
+class MemmapDataset:
+    def __init__(self, root, source):
+        self.root = root
+        self.source = source
+
+    @property
+    def fingerprint(self):
+        return self.source.fingerprint
+
+    def list_folders(self, path=''):
+        return self.source.list_folders(path)
+
+    def list_files(self, path, suffix='.csv'):
+        return self.source.list_files(path, suffix)
+
+    def folder_fingerprint(self, path):
+        return self.source.folder_fingerprint(path)
+
+    def member_size(self, member):
+        return self.source.member_size(member)
+
+    def open(self, member):
+        return self.source.open(member)
+
+    # Directory holding the partitions of a date folder
+    def partition_dir(self, path):
+        return os.path.join(self.root, *[quote(part, safe='') for part in path.split('/')])
+
+    def read_channel(self, path, channel, beads=None):
+        directory = self.partition_dir(path)
+        if not os.path.exists(os.path.join(directory, INDEX)):
+            self.ingest(path)
+        matrix = BeadMatrix.open(directory, channel)
+        if beads is None:
+            return matrix
+        # Projection materializes only the requested bead columns of each file
+        return ChannelData.stack(matrix.files, matrix.split(), beads)
+
+    # Per-file bead moments of one channel in a date folder, from the partition's index
+    def read_moments(self, path, channel):
+        directory = self.partition_dir(path)
+        if not os.path.exists(os.path.join(directory, INDEX)):
+            self.ingest(path)
+        moments = BeadMoments.open(directory, channel)
+        if moments is None:
+            # Partition converted before moments were recorded
+            matrix = BeadMatrix.open(directory, channel)
+            stats = [RunningStats.from_values(values.astype('float64')) for values in matrix.split()]
+            moments = BeadMoments.from_stats(matrix.files, stats)
+            moments.save(directory, channel)
+        return moments
+
+    # {member: reason} of the files of a date folder left out when it was converted
+    def quarantined(self, path):
+        directory = self.partition_dir(path)
+        if not os.path.exists(os.path.join(directory, INDEX)):
+            self.ingest(path)
+        with open(os.path.join(directory, INDEX)) as f:
+            return json.load(f).get('quarantine', {})
+
+    # Append every CSV of a date folder to per-channel float32 files, recording the
+    # bead moments of each file on the way; oversized files are streamed block by
+    # block. Files failing the schema checks are rolled back and quarantined.
+    @timed('extract')
+    def ingest(self, path):
+        directory = self.partition_dir(path)
+        staging = f'{directory}.tmp-{uuid.uuid4().hex}'
+        os.makedirs(staging)
+        files = []
+        rejected = {}
+        layout = {'files': files, 'quarantine': rejected,
+                  'channels': {c: {'starts': [], 'rows': [], 'widths': []} for c in CHANNELS}}
+        outputs = {c: open(os.path.join(staging, f'{c}.f32'), 'wb') for c in CHANNELS}
+        stats = {c: [] for c in CHANNELS}
+        try:
+            for member in self.source.list_files(path, '.csv'):
+                starts = {channel: outputs[channel].tell() for channel in CHANNELS}
+                for channel in CHANNELS:
+                    channel_layout = layout['channels'][channel]
+                    channel_layout['starts'].append(starts[channel] // 4)
+                    channel_layout['rows'].append(0)
+                    channel_layout['widths'].append(0)
+                    stats[channel].append(RunningStats())
+                try:
+                    if is_oversized(self.source, member):
+                        blocks = iter_csv_chunks(self.source, member)
+                    else:
+                        blocks = [read_channels(self.source, member, cache=None)]
+                    for parsed in blocks:
+                        for channel in CHANNELS:
+                            member_stats = RunningStats.from_values(np.asarray(parsed[channel], dtype='float64'))
+                            stats[channel][-1].merge(member_stats)
+                            values = np.ascontiguousarray(parsed[channel], dtype=np.float32)
+                            channel_layout = layout['channels'][channel]
+                            channel_layout['rows'][-1] += values.shape[0]
+                            channel_layout['widths'][-1] = values.shape[1]
+                            outputs[channel].write(values.tobytes())
+                except SchemaError as error:
+                    # Drop whatever the member's earlier blocks wrote
+                    quarantine(self.source, error, rejected)
+                    for channel in CHANNELS:
+                        outputs[channel].seek(starts[channel])
+                        outputs[channel].truncate()
+                        for column in layout['channels'][channel].values():
+                            column.pop()
+                        stats[channel].pop()
+                    continue
+                files.append(member)
+        finally:
+            for output in outputs.values():
+                output.close()
+        with open(os.path.join(staging, INDEX), 'w') as f:
+            json.dump(layout, f)
+        for channel in CHANNELS:
+            BeadMoments.from_stats(files, stats[channel]).save(staging, channel)
+        try:
+            os.replace(staging, directory)
+        except OSError:
+            # Another session converted the same partition first
+            shutil.rmtree(staging, ignore_errors=True)
+
+
+# Function to open (and lazily fill) the memory-mapped store of an archive
+def open_memmap(source, root=DEFAULT_ROOT):
+    return MemmapDataset(os.path.join(root, source.fingerprint), source)
@@ -0,0 +1,133 @@
+"""Process-pool ingest of date folders with partial aggregates merged in the parent"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .cache import default_cache
+from .kernels import CHANNELS
+from .parse import (chunked_stats, folder_quarantine, is_oversized, quarantine, read_channels,
+                    restore_quarantine)
+from .profiling import stage
+from .schema import SchemaError
+from .stats import RunningStats
+
+DEFAULT_WORKERS = int(os.environ.get('LINE4_WORKERS', '1'))
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+# Function to read what date_stats folds of a date folder, the I/O half of it: a
+# store's per-file moments or bead matrices of every channel, or the raw bytes of
+# an archive's files ({member: bytes}, leaving out oversized files, which are
+# streamed, and files already in the parse cache). Files a store left out when
+# it converted the folder are quarantined again from its partition index.
+def read_date(dataset, path, channels=CHANNELS):
+    if hasattr(dataset, 'quarantined'):
+        restore_quarantine(dataset, dataset.quarantined(path))
+    read_moments = getattr(dataset, 'read_moments', None)
+    if read_moments is not None:
+        return {identifier: read_moments(path, identifier) for identifier in channels}
+    if hasattr(dataset, 'ingest'):
+        return {identifier: dataset.read_channel(path, identifier) for identifier in channels}
+    data = {}
+    with stage('extract', step='read', folder=path):
+        for member in dataset.list_files(path, '.csv'):
+            if not is_oversized(dataset, member) and (dataset.fingerprint, member) not in default_cache:
+                with dataset.open(member) as f:
+                    data[member] = f.read()
+    return data
+
+
+# Function to compute the partial aggregate of one date folder: a per-bead
+# RunningStats for every channel, merged over the folder's valid files in order.
+# data is what read_date returned when the folder was read ahead.
+def date_stats(dataset, path, channels=CHANNELS, data=None):
+    # Stores read back the partitions they converted once, moments where they keep them
+    if hasattr(dataset, 'read_moments'):
+        data = read_date(dataset, path, channels) if data is None else data
+        return {identifier: data[identifier].combined() for identifier in channels}
+    if hasattr(dataset, 'ingest'):
+        data = read_date(dataset, path, channels) if data is None else data
+        return {identifier: RunningStats.combine(data[identifier].split()) for identifier in channels}
+    # Raw archives: every file is parsed once for all channels, oversized ones block by block
+    data = {} if data is None else data
+    partial = {identifier: RunningStats() for identifier in channels}
+    for member in dataset.list_files(path, '.csv'):
+        try:
+            if is_oversized(dataset, member):
+                member_stats = chunked_stats(dataset, member, channels=channels)
+            else:
+                parsed = read_channels(dataset, member, data=data.get(member))
+                member_stats = {identifier: RunningStats.from_values(parsed[identifier]) for identifier in channels}
+        except SchemaError as error:
+            quarantine(dataset, error)
+            continue
+        for identifier in channels:
+            partial[identifier].merge(member_stats[identifier])
+    return partial
+
+
+# Function to submit a call to the shared process pool (kept alive across reruns).
+# A different worker count replaces the pool; the old one shuts down once the
+# work already queued on it is done, so other sessions' loads still complete.
+# A pool broken by a dead worker (out of memory, killed) is replaced as well.
+def submit(workers, fn, *args):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is not None and (_executor_workers != workers or getattr(_executor, '_broken', False)):
+            _executor.shutdown(wait=False)
+            _executor = None
+        if _executor is None:
+            _executor, _executor_workers = _start_executor(workers), workers
+        try:
+            return _executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died since the check: retry once on a fresh pool
+            _executor.shutdown(wait=False)
+            _executor = _start_executor(workers)
+            return _executor.submit(fn, *args)
+
+
+# Function to start a process pool
+def _start_executor(workers):
+    # spawn: forking the multi-threaded Streamlit server is not safe
+    context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+# Function to yield date_stats for each date folder in order; with more than one
+# worker the folders are parsed in a process pool and only the partials come back.
+# With a store, folders whose fingerprint is already recorded are not parsed again.
+def iter_date_stats(dataset, paths, workers=DEFAULT_WORKERS, store=None):
+    paths = list(paths)
+    known = {}
+    if store is not None:
+        fingerprints = {path: dataset.folder_fingerprint(path) for path in paths}
+        for path in paths:
+            partial = store.get(path, fingerprints[path])
+            if partial is not None:
+                known[path] = partial
+                restore_quarantine(dataset, store.rejected(path, fingerprints[path]))
+    missing = [path for path in paths if path not in known]
+    if workers <= 1 or len(missing) <= 1:
+        computed = (date_stats(dataset, path) for path in missing)
+    else:
+        futures = [submit(workers, date_stats, dataset, path) for path in missing]
+        computed = (future.result() for future in futures)
+    for path in paths:
+        partial = known.get(path)
+        if partial is None:
+            partial = next(computed)
+            if store is not None:
+                store.put(path, fingerprints[path], partial, folder_quarantine(dataset, path))
+        yield partial
+
+
+# Function to collect iter_date_stats into a list
+def map_date_stats(dataset, paths, workers=DEFAULT_WORKERS, store=None):
+    return list(iter_date_stats(dataset, paths, workers, store))
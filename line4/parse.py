@@ -0,0 +1,143 @@
+"""Parsing of headerless Line 4 bead CSVs into per-channel arrays (pandas is imported on first parse)"""
+
+import io
+import os
+from collections import defaultdict
+
+import numpy as np
+
+from .cache import default_cache
+from .kernels import CHANNELS, split_codes
+from .profiling import stage
+from .schema import SchemaError, check_frame, default_quarantine, describe
+from .stats import RunningStats
+
+# Rows per block when streaming, and the member size above which files are streamed
+CHUNK_ROWS = int(os.environ.get('LINE4_CHUNK_ROWS', '50000'))
+CHUNK_THRESHOLD = int(os.environ.get('LINE4_CHUNK_THRESHOLD', str(256 * 1024 ** 2)))
+
+
+# Function to split a parsed frame into channels by the codes of its categorical
+# label column (unknown labels and NaN are dropped)
+def split_frame(frame, channels=CHANNELS, dtype='float64'):
+    labels = frame[0].cat
+    remap = np.array([channels.index(c) if c in channels else len(channels) for c in labels.categories]
+                     + [len(channels)], dtype=np.int8)
+    codes = remap[labels.codes.to_numpy()]
+    return split_codes(codes, frame.iloc[:, 1:].to_numpy(dtype=dtype), channels)
+
+
+# Function to parse one CSV into a {channel: rows x beads float64 array} mapping
+# with the C engine and explicit dtypes (labels categorical, beads float64); a
+# member that is not a bead CSV raises SchemaError at its first bad row
+def parse_csv(f, channels=CHANNELS, member='<csv>'):
+    import pandas as pd
+
+    try:
+        df = pd.read_csv(f, header=None, dtype=defaultdict(lambda: 'float64', {0: 'category'}))
+    except ValueError as error:
+        raise SchemaError(member, describe(error)) from None
+    check_frame(member, df.shape[1], df[0].cat.categories)
+    return split_frame(df, channels)
+
+
+# Function to read one archive member through the parse cache; data is the
+# member's raw bytes when they were read ahead
+def read_channels(dataset, member, cache=default_cache, data=None):
+    key = (dataset.fingerprint, member)
+    parsed = cache.get(key) if cache is not None else None
+    if parsed is None:
+        source = dataset.open(member) if data is None else io.BytesIO(data)
+        with stage('parse', member=member), source as f:
+            parsed = parse_csv(f, member=member)
+        # Cached arrays are shared between reruns and sessions
+        for values in parsed.values():
+            values.flags.writeable = False
+        if cache is not None:
+            cache.put(key, parsed)
+    return parsed
+
+
+# Function to parse members through the parse cache, skipping those that fail
+# the schema checks; they are quarantined and, with rejected, also collected as
+# {member: reason}. Yields (member, parsed)
+def iter_valid(dataset, members, cache=default_cache, rejected=None):
+    for member in members:
+        try:
+            parsed = read_channels(dataset, member, cache)
+        except SchemaError as error:
+            quarantine(dataset, error, rejected)
+            continue
+        yield member, parsed
+
+
+# Function to record a member that failed the schema checks
+def quarantine(dataset, error, rejected=None):
+    default_quarantine.add(dataset.fingerprint, error.member, error.reason)
+    if rejected is not None:
+        rejected[error.member] = error.reason
+
+
+# Function to collect the quarantined files of a date folder as {member: reason}
+def folder_quarantine(dataset, path):
+    report = default_quarantine.report(dataset.fingerprint)
+    return {member: report[member] for member in dataset.list_files(path, '.csv') if member in report}
+
+
+# Function to record again, under the dataset's archive, files quarantined when a
+# date folder was converted or aggregated before (from a store or partition index)
+def restore_quarantine(dataset, rejected):
+    for member, reason in rejected.items():
+        default_quarantine.add(dataset.fingerprint, member, reason)
+
+
+# Function to tell whether a member is too large to be parsed in one piece
+def is_oversized(dataset, member, threshold=None):
+    return dataset.member_size(member) > (CHUNK_THRESHOLD if threshold is None else threshold)
+
+
+# Function to count the columns of a member from its first line (0 if empty)
+def csv_width(dataset, member):
+    with dataset.open(member) as f:
+        first = f.readline()
+    return first.count(b',') + 1 if first.strip() else 0
+
+
+# Function to stream a member in blocks of chunksize rows, yielding a {channel:
+# rows x beads float32 array} per block; the label column is parsed as a
+# categorical and the beads straight into float32, so peak memory follows the
+# block size rather than the file size. Schema errors are raised when the bad
+# block is reached, so callers must drop what they took from earlier blocks.
+def iter_csv_chunks(dataset, member, chunksize=CHUNK_ROWS, channels=CHANNELS):
+    import pandas as pd
+
+    width = csv_width(dataset, member)
+    if not width:
+        raise SchemaError(member, 'empty file')
+    check_frame(member, width)
+    dtype = {0: 'category', **{column: 'float32' for column in range(1, width)}}
+    labelled, categories = False, []
+    with dataset.open(member) as f, pd.read_csv(f, header=None, dtype=dtype, chunksize=chunksize) as reader:
+        while True:
+            with stage('parse', member=member, chunked=True):
+                try:
+                    chunk = next(reader, None)
+                except ValueError as error:
+                    raise SchemaError(member, describe(error)) from None
+                if chunk is None:
+                    break
+                categories = chunk[0].cat.categories
+                labelled = labelled or any(label in CHANNELS for label in categories)
+                blocks = split_frame(chunk, channels, np.float32)
+            yield blocks
+    if not labelled:
+        check_frame(member, width, categories)
+
+
+# Function to accumulate the per-channel RunningStats of a member block by block
+def chunked_stats(dataset, member, chunksize=CHUNK_ROWS, channels=CHANNELS):
+    stats = {identifier: RunningStats() for identifier in channels}
+    for blocks in iter_csv_chunks(dataset, member, chunksize, channels):
+        for identifier, block in blocks.items():
+            stats[identifier].merge(RunningStats.from_values(block))
+    return stats
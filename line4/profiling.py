@@ -0,0 +1,184 @@
+"""Per-stage timing and memory instrumentation (extract, list, parse, aggregate, detect, plot)
+
+Stages are recorded only while a StageRecorder is active in the current context
+(one Streamlit script run, one CLI invocation); otherwise stage() hands back a
+shared no-op context manager, so instrumented code costs a ContextVar lookup.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+STAGES = ['extract', 'list', 'parse', 'aggregate', 'detect', 'plot']
+
+# Set LINE4_PROFILE=1 to record (and log) stages by default
+PROFILE = os.environ.get('LINE4_PROFILE', '') not in ('', '0')
+
+logger = logging.getLogger('line4.profile')
+
+_active = contextvars.ContextVar('line4_recorder', default=None)
+# Innermost open stage of each context: a thread, or an asyncio task of the loader
+_open = contextvars.ContextVar('line4_stage', default=None)
+_PAGE_MB = os.sysconf('SC_PAGE_SIZE') / 1024 ** 2 if hasattr(os, 'sysconf') else 0
+
+
+# Function to read the resident set size of this process in MiB
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+# Function to read the peak resident set size of this process in MiB
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1024 ** 2
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+# One timed stage; time spent in nested stages is subtracted from self_seconds
+# so per-stage totals add up to the wall time
+class _Stage:
+    __slots__ = ('recorder', 'name', 'fields', 'parent', 'start', 'rss', 'children')
+
+    def __init__(self, recorder, name, fields):
+        self.recorder = recorder
+        self.name = name
+        self.fields = fields
+        self.children = 0.0
+
+    def __enter__(self):
+        self.parent = self.recorder._current
+        self.recorder._current = self
+        self.rss = rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        rss = rss_mb()
+        self.recorder._current = self.parent
+        if self.parent is not None:
+            self.parent.children += seconds
+        self.recorder.add(self.name, seconds, seconds - self.children, rss, rss - self.rss, **self.fields)
+        return False
+
+
+# Collects the stages timed while it is active; each record is a flat dict
+# (stage, seconds, self_seconds, rss_mb, rss_delta_mb, peak_rss_mb and any fields
+# passed to stage()) that is also logged as one JSON line when log is set
+class StageRecorder:
+    def __init__(self, log=PROFILE):
+        self.log = log
+        self.records = []
+        self._lock = threading.Lock()
+        self._token = None
+
+    # Stages nest per context, so concurrent loads on one event loop keep apart
+    @property
+    def _current(self):
+        stage = _open.get()
+        return stage if stage is not None and stage.recorder is self else None
+
+    @_current.setter
+    def _current(self, stage):
+        _open.set(stage)
+
+    # Make this the recorder of the current context (until deactivate())
+    def activate(self):
+        self._token = _active.set(self)
+        return self
+
+    def deactivate(self):
+        if self._token is not None:
+            _active.reset(self._token)
+            self._token = None
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, *exc):
+        self.deactivate()
+
+    def add(self, stage, seconds, self_seconds, rss, rss_delta, **fields):
+        record = {'stage': stage, 'seconds': seconds, 'self_seconds': self_seconds,
+                  'rss_mb': rss, 'rss_delta_mb': rss_delta, 'peak_rss_mb': max(rss, peak_rss_mb()), **fields}
+        with self._lock:
+            self.records.append(record)
+        if self.log:
+            logger.info(json.dumps(record, default=str))
+
+    # Totals per stage in STAGES order: calls, self time, largest RSS growth and peak RSS
+    def summary(self):
+        totals = {}
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            total = totals.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'seconds': 0.0,
+                                                        'max_rss_delta_mb': 0.0, 'peak_rss_mb': 0.0})
+            total['calls'] += 1
+            total['seconds'] += record['self_seconds']
+            total['max_rss_delta_mb'] = max(total['max_rss_delta_mb'], record['rss_delta_mb'])
+            total['peak_rss_mb'] = max(total['peak_rss_mb'], record['peak_rss_mb'])
+        order = {name: i for i, name in enumerate(STAGES)}
+        return sorted(totals.values(), key=lambda total: order.get(total['stage'], len(order)))
+
+    # Records as JSON lines, for download or log shipping
+    def to_jsonl(self):
+        with self._lock:
+            records = list(self.records)
+        return ''.join(json.dumps(record, default=str) + '\n' for record in records)
+
+
+# Function to get the recorder of the current context, or None when profiling is off
+def active_recorder():
+    return _active.get()
+
+
+# Function to make recorder (or None to switch profiling off) the recorder of the
+# current context for good, e.g. for the rest of a Streamlit script run
+def use_recorder(recorder):
+    _active.set(recorder)
+    return recorder
+
+
+# Function to time a block as one stage: with stage('parse', member=name): ...
+def stage(name, **fields):
+    recorder = _active.get()
+    if recorder is None:
+        return _NULL_STAGE
+    return _Stage(recorder, name, fields)
+
+
+# Decorator recording every call of a function as one stage
+def timed(name):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active.get() is None:
+                return fn(*args, **kwargs)
+            with _Stage(_active.get(), name, {'step': fn.__name__}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
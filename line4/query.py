@@ -0,0 +1,114 @@
+"""Lazy query plans over (folder, date, channel) partitions"""
+
+import posixpath
+from collections import namedtuple
+
+import numpy as np
+
+from .kernels import CHANNELS
+from .memmap import BeadMoments
+from .parallel import DEFAULT_WORKERS, iter_date_stats
+from .profiling import stage, timed
+from .stats import RunningStats
+
+
+# One unit of data a view can ask for: a channel of one date folder
+class Partition(namedtuple('Partition', ['folder', 'date', 'channel'])):
+    __slots__ = ()
+
+    @property
+    def path(self):
+        return posixpath.join(self.folder, self.date)
+
+
+# Function to list the partitions a view needs, in display order, without reading
+# any data (dates=None means every date folder of each folder)
+@timed('list')
+def plan(dataset, folders, channels=CHANNELS, dates=None):
+    partitions = []
+    for folder in folders:
+        for date in dataset.list_folders(folder) if dates is None else dates:
+            partitions.extend(Partition(folder, date, channel) for channel in channels)
+    return partitions
+
+
+# Function to read the bead matrix of each planned partition, one at a time and in order
+def iter_channels(dataset, partitions):
+    for partition in partitions:
+        yield partition, dataset.read_channel(partition.path, partition.channel)
+
+
+# Function to read the per-file bead moments of each planned partition, from the
+# dataset's moments index when it keeps one (memory-mapped stores), otherwise
+# computed from the bead matrices
+def iter_moments(dataset, partitions):
+    read_moments = getattr(dataset, 'read_moments', None)
+    for partition in partitions:
+        if read_moments is not None:
+            yield partition, read_moments(partition.path, partition.channel)
+            continue
+        channel_data = dataset.read_channel(partition.path, partition.channel)
+        stats = [RunningStats.from_values(values) for values in channel_data.split()]
+        yield partition, BeadMoments.from_stats(channel_data.files, stats)
+
+
+# Function to group a plan by folder: {folder: (dates, channels)} in plan order
+def group_partitions(partitions):
+    folders = {}
+    for partition in partitions:
+        dates, channels = folders.setdefault(partition.folder, ({}, {}))
+        dates[partition.date] = None
+        channels[partition.channel] = None
+    return {folder: (list(dates), list(channels)) for folder, (dates, channels) in folders.items()}
+
+
+# Function to aggregate a plan folder by folder, yielding (folder, {channel: {date:
+# RunningStats}}) as soon as each folder is done so views can draw progressively
+def iter_folder_stats(dataset, partitions, workers=DEFAULT_WORKERS, store=None):
+    for folder, (dates, channels) in group_partitions(partitions).items():
+        paths = [posixpath.join(folder, date) for date in dates]
+        folder_stats = {channel: {} for channel in channels}
+        with stage('aggregate', folder=folder, dates=len(paths)):
+            for date, partial in zip(dates, iter_date_stats(dataset, paths, workers, store)):
+                for channel in channels:
+                    folder_stats[channel][date] = partial[channel]
+        yield folder, folder_stats
+
+
+# Function to pool a folder's per-date statistics into the mean of each bead
+def bead_means(folder_stats):
+    return {channel: RunningStats.combine(date_stats.values()).mean for channel, date_stats in folder_stats.items()}
+
+
+# Function to reduce a folder's per-date statistics to one mean per date, pooled
+# over every bead of every file
+def date_means(folder_stats):
+    return {channel: {date: float(stats.total().mean) for date, stats in date_stats.items()}
+            for channel, date_stats in folder_stats.items()}
+
+
+# Function to reduce a folder's per-date statistics to a (mean, std) pair per date
+def date_moments(folder_stats):
+    moments = {}
+    for channel, date_stats in folder_stats.items():
+        moments[channel] = {}
+        for date, stats in date_stats.items():
+            total = stats.total()
+            moments[channel][date] = (float(total.mean), float(total.std()))
+    return moments
+
+
+# Function to lay a folder's per-date bead means out as one date x bead float32
+# grid per channel, NaN where a date has no rows for a bead; returns
+# {channel: (dates, grid)} with dates sorted like the grid rows
+def date_bead_means(folder_stats):
+    grids = {}
+    for channel, date_stats in folder_stats.items():
+        dates = sorted(date_stats)
+        beads = max((np.atleast_1d(stats.count).shape[0] for stats in date_stats.values()), default=0)
+        grid = np.full((len(dates), beads), np.nan, dtype=np.float32)
+        for j, date in enumerate(dates):
+            means = np.atleast_1d(date_stats[date].mean)
+            grid[j, :len(means)] = means
+        grids[channel] = (np.array(dates, dtype=object), grid)
+    return grids
@@ -0,0 +1,89 @@
+"""Schema checks of bead CSVs and the quarantine of members that fail them
+
+A bead CSV has a channel label in column 0 and numeric bead values in every
+other column, rows no wider than the first. A member that breaks this fails on
+its first bad row and is skipped with a recorded reason, so one malformed file
+costs its own data rather than the whole aggregation. Reasons are appended to
+<workspace>/quarantine/<archive hash>.jsonl, which worker processes share.
+"""
+
+import json
+import os
+import threading
+
+from .kernels import CHANNELS
+from .workspace import DEFAULT_WORKSPACE
+
+DEFAULT_QUARANTINE = os.path.join(DEFAULT_WORKSPACE, 'quarantine')
+
+
+# A member that does not look like a bead CSV
+class SchemaError(ValueError):
+    def __init__(self, member, reason):
+        super().__init__(f'{member}: {reason}')
+        self.member = member
+        self.reason = reason
+
+    def __reduce__(self):
+        return SchemaError, (self.member, self.reason)
+
+
+# Function to describe a pandas read error in one line
+def describe(error):
+    name = type(error).__name__
+    if name == 'EmptyDataError':
+        return 'empty file'
+    message = str(error).strip().splitlines()[0] if str(error).strip() else name
+    return message.replace('Error tokenizing data. C error: ', 'ragged rows: ')
+
+
+# Function to check the shape and labels of a parsed member: at least one bead
+# column and, when labels are given, at least one known channel label among
+# them (other labels are dropped later)
+def check_frame(member, width, labels=None):
+    if width < 2:
+        raise SchemaError(member, 'no bead columns')
+    if labels is not None and not any(label in CHANNELS for label in labels):
+        found = f', found {", ".join(map(str, list(labels)[:3]))}' if len(labels) else ''
+        raise SchemaError(member, f'no channel labels ({", ".join(CHANNELS)}) in column 0{found}')
+
+
+# Members skipped as malformed, per archive: member -> reason
+class QuarantineLog:
+    def __init__(self, root=DEFAULT_QUARANTINE):
+        self.root = root
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def path(self, fingerprint):
+        return os.path.join(self.root, f'{fingerprint}.jsonl')
+
+    # Record a member once per process (one line per append, safe across processes);
+    # once the log is gone (evicted with its archive) members are recorded again
+    def add(self, fingerprint, member, reason):
+        with self._lock:
+            if not os.path.exists(self.path(fingerprint)):
+                self._seen = {key for key in self._seen if key[0] != fingerprint}
+            if (fingerprint, member) in self._seen:
+                return
+            self._seen.add((fingerprint, member))
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.path(fingerprint), 'a') as f:
+                f.write(json.dumps({'member': member, 'reason': reason}) + '\n')
+
+    # {member: reason} of every member quarantined from an archive
+    def report(self, fingerprint):
+        report = {}
+        try:
+            with open(self.path(fingerprint)) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        report[record['member']] = record['reason']
+        except (OSError, ValueError):
+            pass  # nothing quarantined, or a line still being written
+        return dict(sorted(report.items()))
+
+
+# Process-wide quarantine log under the default workspace
+default_quarantine = QuarantineLog()
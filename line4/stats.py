@@ -0,0 +1,83 @@
+"""Mergeable running statistics (Chan et al. parallel variance)"""
+
+import numpy as np
+
+from .kernels import bead_moments
+
+
+# Count, mean and sum of squared deviations (M2) per bead. Two accumulators merge
+# exactly, so files, dates and folders combine in O(beads) memory without
+# keeping any rows; total() pools the beads into one channel-level figure.
+class RunningStats:
+    __slots__ = ('count', 'mean_', 'm2')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        count = np.asarray(count, dtype=np.int64)
+        empty = count == 0
+        self.count = count
+        # Empty beads hold a zero mean internally so merges stay NaN-free
+        self.mean_ = np.where(empty, 0.0, np.asarray(mean, dtype='float64'))
+        self.m2 = np.where(empty, 0.0, np.asarray(m2, dtype='float64'))
+
+    # Accumulator of a rows x beads matrix
+    @classmethod
+    def from_values(cls, values):
+        return cls(*bead_moments(values))
+
+    # Accumulator over many matrices or accumulators
+    @classmethod
+    def combine(cls, items):
+        stats = cls()
+        for item in items:
+            stats.merge(item if isinstance(item, RunningStats) else cls.from_values(item))
+        return stats
+
+    @property
+    def mean(self):
+        return np.where(self.count > 0, self.mean_, np.nan)
+
+    def var(self, ddof=1):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+    def std(self, ddof=1):
+        return np.sqrt(self.var(ddof))
+
+    # Merge another accumulator in place (beads missing on one side count as empty)
+    def merge(self, other):
+        count_a, mean_a, m2_a = _pad(self, other.count.shape)
+        count_b, mean_b, m2_b = _pad(other, count_a.shape)
+        count = count_a + count_b
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(count > 0, count_b / count, 0.0)
+        delta = mean_b - mean_a
+        self.mean_ = mean_a + delta * weight
+        self.m2 = m2_a + m2_b + delta * delta * count_a * weight
+        self.count = count
+        return self
+
+    def __add__(self, other):
+        return RunningStats(self.count, self.mean_, self.m2).merge(other)
+
+    # Pool all beads into a single channel-level accumulator
+    def total(self):
+        count = self.count.sum()
+        if count == 0:
+            return RunningStats()
+        mean = (self.count * self.mean_).sum() / count
+        m2 = self.m2.sum() + (self.count * (self.mean_ - mean) ** 2).sum()
+        return RunningStats(count, mean, m2)
+
+    def __repr__(self):
+        return f'RunningStats(count={self.count!r}, mean={self.mean!r}, std={self.std()!r})'
+
+
+# Function to widen per-bead arrays to a common length, padding with empty beads
+def _pad(stats, shape):
+    count, mean, m2 = stats.count, stats.mean_, stats.m2
+    if shape and count.ndim == 0 and count == 0:
+        return np.zeros(shape, np.int64), np.zeros(shape), np.zeros(shape)
+    if shape and count.ndim == 1 and shape[0] > count.shape[0]:
+        extra = (0, shape[0] - count.shape[0])
+        return np.pad(count, extra), np.pad(mean, extra), np.pad(m2, extra)
+    return count, mean, m2
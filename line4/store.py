@@ -0,0 +1,108 @@
+"""Persistent per-date aggregate store (SQLite) for incremental re-ingest"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from .stats import RunningStats
+from .workspace import DEFAULT_WORKSPACE
+
+DEFAULT_STORE = os.environ.get('LINE4_STORE', os.path.join(DEFAULT_WORKSPACE, 'aggregates.sqlite'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS date_stats (
+    folder TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    count BLOB NOT NULL,
+    mean BLOB NOT NULL,
+    m2 BLOB NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (folder, fingerprint, channel)
+)
+'''
+
+REJECTED_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rejected (
+    folder TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    member TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    PRIMARY KEY (folder, fingerprint, member)
+)
+'''
+
+
+# Per-channel RunningStats of every ingested date folder, keyed on the folder
+# path and its fingerprint: a re-uploaded archive only has to parse the date
+# folders that are new or whose files changed. The files a folder's aggregates
+# leave out are kept with them, so the skipped files can still be reported.
+class AggregateStore:
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(SCHEMA)
+        self._db.execute(REJECTED_SCHEMA)
+        self._lock = threading.Lock()
+
+    # Stored {channel: RunningStats} of a date folder, or None if it was never
+    # ingested with this fingerprint
+    def get(self, folder, fingerprint):
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT channel, count, mean, m2 FROM date_stats WHERE folder = ? AND fingerprint = ?',
+                (folder, fingerprint)).fetchall()
+        if not rows:
+            return None
+        return {
+            channel: RunningStats(np.frombuffer(count, np.int64), np.frombuffer(mean), np.frombuffer(m2))
+            for channel, count, mean, m2 in rows
+        }
+
+    # {member: reason} of the files left out of a stored date folder
+    def rejected(self, folder, fingerprint):
+        with self._lock:
+            rows = self._db.execute('SELECT member, reason FROM rejected WHERE folder = ? AND fingerprint = ?',
+                                    (folder, fingerprint)).fetchall()
+        return dict(rows)
+
+    # Record the {channel: RunningStats} of a date folder and the {member: reason}
+    # of its files that failed the schema checks
+    def put(self, folder, fingerprint, partial, rejected=None):
+        now = time.time()
+        rows = []
+        for channel, stats in partial.items():
+            if stats.count.ndim == 0:
+                # Channel without any rows in this folder
+                count, mean, m2 = np.zeros(0, np.int64), np.zeros(0), np.zeros(0)
+            else:
+                count, mean, m2 = stats.count, stats.mean_, stats.m2
+            rows.append((folder, fingerprint, channel, count.astype(np.int64).tobytes(),
+                         mean.astype('float64').tobytes(), m2.astype('float64').tobytes(), now))
+        with self._lock, self._db:
+            self._db.executemany('INSERT OR REPLACE INTO date_stats VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self._db.executemany('INSERT OR REPLACE INTO rejected VALUES (?, ?, ?, ?)',
+                                 [(folder, fingerprint, member, reason) for member, reason in (rejected or {}).items()])
+
+    # Drop entries whose fingerprint was superseded more than max_age seconds ago;
+    # returns the number of rows removed
+    def prune(self, max_age=30 * 24 * 3600):
+        cutoff = time.time() - max_age
+        with self._lock, self._db:
+            removed = self._db.execute(
+                'DELETE FROM date_stats WHERE updated < ? AND EXISTS ('
+                ' SELECT 1 FROM date_stats AS newer WHERE newer.folder = date_stats.folder'
+                ' AND newer.updated > date_stats.updated)', (cutoff,)).rowcount
+            return removed + self._db.execute(
+                'DELETE FROM rejected WHERE NOT EXISTS ('
+                ' SELECT 1 FROM date_stats WHERE date_stats.folder = rejected.folder'
+                ' AND date_stats.fingerprint = rejected.fingerprint)').rowcount
+
+    def close(self):
+        self._db.close()
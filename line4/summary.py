@@ -0,0 +1,135 @@
+"""Precomputed per-date aggregates in a long-format Parquet file
+
+One row per (folder, date, channel, bead) with the bead's count, mean and M2, so
+the date-level views can be rendered without the archive. A channel without any
+rows in a date folder is kept as a single bead-0 row with a zero count.
+"""
+
+import json
+import posixpath
+
+import numpy as np
+
+from .kernels import CHANNELS
+from .parallel import DEFAULT_WORKERS
+from .query import iter_folder_stats, plan
+from .stats import RunningStats
+
+COLUMNS = ['folder', 'date', 'channel', 'fingerprint', 'bead', 'count', 'mean', 'm2']
+METADATA_KEY = b'line4'
+
+
+# Function to aggregate the folders of a dataset (all of them by default) and
+# write the summary file; returns the number of date folders written
+def write_summary(dataset, path, folders=None, workers=DEFAULT_WORKERS, store=None, channels=CHANNELS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    folders = dataset.list_folders() if folders is None else folders
+    keys, lengths = [], []
+    columns = {name: [] for name in COLUMNS[4:]}
+    dates = 0
+    for folder, folder_stats in iter_folder_stats(dataset, plan(dataset, folders, channels), workers, store):
+        for channel, date_stats in folder_stats.items():
+            for date, stats in date_stats.items():
+                count, mean, m2 = stats.count, stats.mean_, stats.m2
+                if count.ndim == 0:
+                    count, mean, m2 = np.zeros(1, np.int64), np.zeros(1), np.zeros(1)
+                    beads = np.zeros(1, np.int32)
+                else:
+                    beads = np.arange(1, len(count) + 1, dtype=np.int32)
+                keys.append((folder, date, channel, dataset.folder_fingerprint(posixpath.join(folder, date))))
+                lengths.append(len(beads))
+                columns['bead'].append(beads)
+                columns['count'].append(count.astype(np.int64))
+                columns['mean'].append(mean.astype('float64'))
+                columns['m2'].append(m2.astype('float64'))
+        dates += len(next(iter(folder_stats.values()), {}))
+    # Labels are dictionary-encoded: one code per row, each distinct string stored once
+    arrays = {}
+    for j, name in enumerate(COLUMNS[:4]):
+        labels, codes = np.unique(np.array([key[j] for key in keys], dtype=object), return_inverse=True)
+        indices = pa.array(np.repeat(codes, lengths).astype(np.int32))
+        arrays[name] = pa.DictionaryArray.from_arrays(indices, pa.array(labels.tolist(), pa.string()))
+    for name, dtype in zip(COLUMNS[4:], (np.int32, np.int64, np.float64, np.float64)):
+        arrays[name] = pa.array(np.concatenate(columns[name]) if columns[name] else np.zeros(0, dtype))
+    table = pa.table(arrays)
+    metadata = {'fingerprint': dataset.fingerprint, 'folders': list(folders), 'channels': list(channels)}
+    table = table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata).encode()})
+    pq.write_table(table, path)
+    return dates
+
+
+# Summary file opened as a read-only dataset that is also its own aggregate
+# store: iter_folder_stats(summary, partitions, store=summary) finds every date
+# folder recorded and never has to read raw data
+class SummaryDataset:
+    def __init__(self, source):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(source)
+        metadata = json.loads(table.schema.metadata[METADATA_KEY])
+        self.source = source
+        self._fingerprint = metadata['fingerprint']
+        self._folders = {'': list(metadata['folders'])}
+        self._fingerprints = {}
+        self._stats = {}
+        df = table.to_pandas()
+        for (folder, date, channel), group in df.groupby(['folder', 'date', 'channel'], sort=False, observed=True):
+            path = posixpath.join(folder, date)
+            dates = self._folders.setdefault(folder, [])
+            if date not in dates:
+                dates.append(date)
+            self._fingerprints[path] = group['fingerprint'].iloc[0]
+            if group['bead'].iloc[0] == 0:
+                stats = RunningStats()
+            else:
+                stats = RunningStats(group['count'].to_numpy(), group['mean'].to_numpy(), group['m2'].to_numpy())
+            self._stats.setdefault(path, {})[channel] = stats
+        for folder in self._folders['']:
+            self._folders.setdefault(folder, []).sort()
+
+    @property
+    def fingerprint(self):
+        return self._fingerprint
+
+    def list_folders(self, path=''):
+        return list(self._folders.get(path, ()))
+
+    # Raw files are not part of a summary
+    def list_files(self, path, suffix='.csv'):
+        return []
+
+    def folder_fingerprint(self, path):
+        return self._fingerprints[path]
+
+    def member_size(self, member):
+        raise KeyError(f'{member}: raw members are not kept in a summary')
+
+    def open(self, member):
+        raise KeyError(f'{member}: raw members are not kept in a summary')
+
+    def read_channel(self, path, channel, beads=None):
+        raise KeyError(f'{path}: a summary only holds aggregates, open the archive for bead matrices')
+
+    # Already on disk or in memory, nothing to hand to worker processes
+    def spool(self, directory=None):
+        return self
+
+    # Store interface: the recorded {channel: RunningStats} of a date folder
+    def get(self, folder, fingerprint):
+        if self._fingerprints.get(folder) != fingerprint:
+            return None
+        return dict(self._stats[folder])
+
+    # Summaries do not record skipped files
+    def rejected(self, folder, fingerprint):
+        return {}
+
+    def put(self, folder, fingerprint, partial, rejected=None):
+        pass
+
+
+# Function to open a summary file (path or file object)
+def read_summary(source):
+    return SummaryDataset(source)
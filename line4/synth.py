@@ -0,0 +1,61 @@
+"""Synthetic Line 4 archives for benchmarks: <base>/<date>/<file>.csv members with
+rows labelled Ch01/Ch02/Ch03 and no header, like the welding line exports"""
+
+import datetime
+import os
+import zipfile
+
+import numpy as np
+
+from .kernels import CHANNELS
+
+# Typical level and spread of each channel's readings
+CHANNEL_LEVELS = {'Ch01': (1.0, 0.5), 'Ch02': (2.0, 0.3), 'Ch03': (0.5, 0.2)}
+
+
+# Function to render one bead CSV: rows per channel, each a label followed by
+# the bead values; bead_jitter shortens some files to mimic partial welds
+def make_csv(rng, rows, beads, drift=0.0, bead_jitter=0):
+    width = beads - int(rng.integers(0, bead_jitter + 1)) if bead_jitter else beads
+    row_format = ','.join(['%s'] + ['%.6f'] * width)
+    lines = []
+    for channel in CHANNELS:
+        level, spread = CHANNEL_LEVELS.get(channel, (1.0, 0.5))
+        values = rng.normal(level + drift, spread, (rows, width))
+        lines.extend(row_format % (channel, *row) for row in values)
+    lines.append('')
+    return '\n'.join(lines).encode()
+
+
+# Function to yield (member name, CSV bytes) of a synthetic tree; dates are
+# consecutive days and every date drifts the readings a little
+def iter_members(bases=2, dates=5, files=10, beads=100, rows=20, seed=0, bead_jitter=0, start='2024-11-01'):
+    rng = np.random.default_rng(seed)
+    first = datetime.date.fromisoformat(start)
+    for b in range(bases):
+        for d in range(dates):
+            date = (first + datetime.timedelta(days=d)).isoformat()
+            for f in range(files):
+                name = f'Line4_{b + 1:02d}/{date}/{date}_{f + 1:05d}.csv'
+                yield name, make_csv(rng, rows, beads, drift=0.01 * d, bead_jitter=bead_jitter)
+
+
+# Function to write a synthetic archive as a ZIP file; returns its size in bytes.
+# Noise barely compresses, so the fastest deflate level is used by default.
+def write_archive(path, compression=zipfile.ZIP_DEFLATED, compresslevel=1, **params):
+    with zipfile.ZipFile(path, 'w', compression, compresslevel=compresslevel) as archive:
+        for name, data in iter_members(**params):
+            archive.writestr(name, data)
+    return os.path.getsize(path)
+
+
+# Function to write a synthetic tree as plain folders; returns its size in bytes
+def write_tree(root, **params):
+    size = 0
+    for name, data in iter_members(**params):
+        path = os.path.join(root, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        size += len(data)
+    return size
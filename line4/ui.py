@@ -0,0 +1,172 @@
+"""Streamlit building blocks shared by the six views (only the apps import this module)"""
+
+import os
+
+import streamlit as st
+
+from .backends import STORES, open_dataset
+from .drift import DEFAULT_DETECTORS, DETECTORS, detect_drift
+from .parallel import DEFAULT_WORKERS
+from .profiling import PROFILE, StageRecorder, stage, use_recorder
+from .schema import default_quarantine
+from .store import AggregateStore
+from .summary import SummaryDataset
+from .workspace import default_workspace
+
+
+# Function to open an upload behind a columnar or memory-mapped store in the shared
+# workspace (date folders are converted from the zip on first use); a .parquet
+# upload is a summary written by `python -m line4 summarize` and is opened as it is.
+# Identical archives uploaded by different sessions share one store, and the
+# session holds a lease on it so it is not evicted while the session is open.
+def open_upload(uploaded_file, store='columnar'):
+    if uploaded_file.name.endswith('.parquet'):
+        return open_summary(uploaded_file.file_id, uploaded_file)
+    archive = open_archive(uploaded_file.file_id, uploaded_file)
+    lease_archive(archive.fingerprint)
+    return open_stored(archive.fingerprint, store, archive)
+
+
+# Function to open a summary upload
+@st.cache_resource(max_entries=4)
+def open_summary(file_id, _uploaded_file):
+    return SummaryDataset(_uploaded_file)
+
+
+# Function to index an uploaded archive; only its central directory is read
+@st.cache_resource(max_entries=4)
+def open_archive(file_id, _uploaded_file):
+    return open_dataset(_uploaded_file, backend='zip')
+
+
+# Function to open the store of an archive, keyed by content so every session
+# uploading the same archive gets the same dataset
+@st.cache_resource(max_entries=8)
+def open_stored(archive_hash, store, _archive):
+    return default_workspace.open(_archive, store)
+
+
+# Function to lease an archive for the rest of this session; the lease is
+# released when the session ends and its session-scoped cache is cleared
+@st.cache_resource(scope='session', on_release=lambda lease: lease.release())
+def lease_archive(archive_hash):
+    return default_workspace.acquire(archive_hash)
+
+
+# Function to back a store with an on-disk copy of the upload that worker processes can reopen
+@st.cache_resource(max_entries=8)
+def open_spooled(archive_hash, _dataset):
+    return default_workspace.spool(_dataset)
+
+
+# Function to drop the cached datasets of an archive once the workspace has
+# removed its files, so the next session opening it converts and spools it again
+def forget_archive(archive_hash):
+    open_spooled.clear(archive_hash, None)
+    for store in STORES:
+        open_stored.clear(archive_hash, store, None)
+
+
+default_workspace.on_remove(forget_archive)
+
+
+# Function to open the persistent per-date aggregate store shared by all sessions,
+# dropping superseded entries once per server start
+@st.cache_resource
+def open_store():
+    store = AggregateStore()
+    store.prune()
+    return store
+
+
+# Function to pick the aggregates of a view: a summary upload carries its own,
+# an archive goes through the shared store
+def aggregates_for(dataset):
+    return dataset if isinstance(dataset, SummaryDataset) else open_store()
+
+
+# Function to ask for the number of worker processes parsing date folders in
+# parallel; returns (dataset, workers), spooling the upload when workers > 1
+def select_workers(dataset):
+    if isinstance(dataset, SummaryDataset):
+        return dataset, 1
+    max_workers = os.cpu_count() or 1
+    workers = st.sidebar.number_input('Ingest workers', min_value=1, max_value=max_workers,
+                                      value=min(DEFAULT_WORKERS, max_workers))
+    if workers > 1:
+        dataset = open_spooled(dataset.fingerprint, dataset)
+    return dataset, workers
+
+
+# Function to ask which detectors flag drift and anomalies on the charts (none
+# switches detection off)
+def select_detectors():
+    return st.sidebar.multiselect('Flag drift with', list(DETECTORS), default=list(DEFAULT_DETECTORS),
+                                  format_func=DETECTORS.get)
+
+
+# Function to score the loaded folders of a channel with the selected detectors;
+# returns the flagged points to overlay, or None when detection is off
+def flag_drift(folder_stats, identifier, detectors):
+    if not detectors or not folder_stats:
+        return None
+    return detect_drift(folder_stats, identifier, detectors).anomalies()
+
+
+# Function to add the sidebar switch for stage timings; returns the recorder of
+# this script run, or None when the panel is off (instrumentation is then a no-op)
+def start_profiling():
+    enabled = st.sidebar.checkbox('Show stage timings', value=PROFILE)
+    return use_recorder(StageRecorder() if enabled else None)
+
+
+# Function to make the on_progress callback of stream_folder_stats: a progress bar
+# that disappears once everything is loaded. Each update is also where Streamlit
+# stops a run whose widgets changed, which cancels the rest of the load.
+def load_progress():
+    bar = st.empty()
+
+    def update(done, total):
+        if done >= total:
+            bar.empty()
+        else:
+            bar.progress(done / total, text=f'Loaded {done} of {total} date folders')
+
+    return update
+
+
+# Function to draw a figure into a container (st, a column or an st.empty
+# placeholder); serializing the figure is timed as part of the plot stage
+def show_chart(container, fig, **kwargs):
+    with stage('plot', step='plotly_chart'):
+        container.plotly_chart(fig, **kwargs)
+
+
+# Function to report the files of an upload that were skipped because they are
+# not bead CSVs (bad labels, non-numeric values, ragged rows), with the reasons
+def show_quarantine(dataset):
+    report = default_quarantine.report(dataset.fingerprint)
+    if not report:
+        return
+    st.warning(f'{len(report)} malformed CSV file(s) were skipped; the charts leave them out')
+    with st.expander('Skipped files'):
+        st.dataframe([{'file': member, 'problem': reason} for member, reason in report.items()], hide_index=True)
+
+
+# Function to render the stage totals of this run in the sidebar, with the raw
+# records as a JSON-lines download
+def show_profile(recorder):
+    if recorder is None:
+        return
+    st.sidebar.subheader('Stage timings')
+    rows = recorder.summary()
+    if not rows:
+        st.sidebar.caption('Nothing was loaded in this run')
+        return
+    st.sidebar.dataframe(
+        [{'stage': row['stage'], 'calls': row['calls'], 'seconds': round(row['seconds'], 3),
+          'RSS growth (MiB)': round(row['max_rss_delta_mb'], 1), 'peak RSS (MiB)': round(row['peak_rss_mb'], 1)}
+         for row in rows],
+        hide_index=True)
+    st.sidebar.download_button('Download stage log', recorder.to_jsonl(), file_name='line4-stages.jsonl',
+                               mime='application/jsonl')
@@ -0,0 +1,177 @@
+"""Content-addressed workspace shared by all sessions, with leases and size-based eviction
+
+Everything derived from an archive lives under the workspace root keyed by the
+archive fingerprint (columnar/<hash>, memmap/<hash>, archives/<hash>.zip), so
+identical uploads are converted once however many sessions open them. Sessions
+hold a lease on the archives they use; when the workspace grows past its budget
+the least recently used archives without a lease are removed.
+"""
+
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+
+from .cache import default_cache
+
+DEFAULT_WORKSPACE = os.environ.get('LINE4_WORKSPACE', '.line4')
+MAX_BYTES = int(os.environ.get('LINE4_WORKSPACE_MAX_BYTES', str(20 * 1024 ** 3)))
+
+# Per-archive directories and files, relative to the workspace root
+KINDS = {'columnar': '{}', 'memmap': '{}', 'archives': '{}.zip', 'quarantine': '{}.jsonl'}
+LEASES = 'leases'
+
+
+# A session's hold on one archive; released explicitly, on exit, or once
+class Lease:
+    def __init__(self, workspace, archive_hash):
+        self.workspace = workspace
+        self.archive_hash = archive_hash
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.workspace.release(self.archive_hash)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Workspace:
+    # min_age protects archives used that recently from eviction, which covers
+    # other processes (CLI runs, other servers) sharing the same root: lease
+    # counts are per process, last-use times are on disk
+    def __init__(self, root=DEFAULT_WORKSPACE, max_bytes=MAX_BYTES, min_age=600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self._refs = Counter()
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    # Path of one kind of data of an archive
+    def path(self, kind, archive_hash):
+        return os.path.join(self.root, kind, KINDS[kind].format(archive_hash))
+
+    def _touch(self, archive_hash):
+        marker = os.path.join(self.root, LEASES, archive_hash)
+        os.makedirs(os.path.dirname(marker), exist_ok=True)
+        with open(marker, 'a'):
+            os.utime(marker)
+
+    # Open a dataset behind one of the stores ('columnar', 'memmap') kept in this workspace
+    def open(self, dataset, store):
+        from .backends import STORES
+
+        return STORES[store](dataset, root=os.path.join(self.root, store))
+
+    # On-disk copy of an uploaded archive in this workspace, for worker processes
+    def spool(self, dataset):
+        return dataset.spool(os.path.join(self.root, 'archives'))
+
+    # Call listener(archive_hash) after an archive is removed, so handles on its
+    # files held in memory (open datasets, cached resources) can be dropped
+    def on_remove(self, listener):
+        self._listeners.append(listener)
+
+    # Take a lease on an archive; a first lease on an archive may evict others
+    def acquire(self, archive_hash):
+        with self._lock:
+            first = self._refs[archive_hash] == 0
+            self._refs[archive_hash] += 1
+            self._touch(archive_hash)
+        if first:
+            self.evict()
+        return Lease(self, archive_hash)
+
+    def release(self, archive_hash):
+        with self._lock:
+            self._refs[archive_hash] -= 1
+            if self._refs[archive_hash] <= 0:
+                del self._refs[archive_hash]
+            self._touch(archive_hash)
+
+    # Number of leases this process holds on an archive
+    def refs(self, archive_hash):
+        return self._refs.get(archive_hash, 0)
+
+    # {hash: {'bytes', 'last_used', 'refs'}} of every archive in the workspace
+    def entries(self):
+        entries = {}
+        for kind, pattern in KINDS.items():
+            directory = os.path.join(self.root, kind)
+            if not os.path.isdir(directory):
+                continue
+            suffix = pattern.format('')
+            for name in os.listdir(directory):
+                if '.tmp-' in name or not name.endswith(suffix):
+                    continue
+                archive_hash = name[:len(name) - len(suffix)] if suffix else name
+                entry = entries.setdefault(archive_hash, {'bytes': 0, 'last_used': 0.0, 'refs': 0})
+                entry['bytes'] += _size(os.path.join(directory, name))
+        for archive_hash, entry in entries.items():
+            marker = os.path.join(self.root, LEASES, archive_hash)
+            entry['last_used'] = os.path.getmtime(marker) if os.path.exists(marker) else 0.0
+            entry['refs'] = self.refs(archive_hash)
+        return entries
+
+    # Total size of the workspace's archive data in bytes
+    def usage(self):
+        return sum(entry['bytes'] for entry in self.entries().values())
+
+    # Remove the least recently used archives without a lease until the
+    # workspace fits in max_bytes; returns the removed hashes
+    def evict(self, max_bytes=None):
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(entry['bytes'] for entry in entries.values())
+        evicted = []
+        cutoff = time.time() - self.min_age
+        for archive_hash, entry in sorted(entries.items(), key=lambda item: item[1]['last_used']):
+            if total <= max_bytes:
+                break
+            if entry['refs'] or entry['last_used'] > cutoff:
+                continue
+            self.remove(archive_hash)
+            total -= entry['bytes']
+            evicted.append(archive_hash)
+        return evicted
+
+    # Delete everything derived from one archive, on disk, in the parse cache and
+    # in whatever the listeners hold
+    def remove(self, archive_hash):
+        for kind in KINDS:
+            path = self.path(kind, archive_hash)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+        marker = os.path.join(self.root, LEASES, archive_hash)
+        if os.path.exists(marker):
+            os.remove(marker)
+        default_cache.evict(archive_hash)
+        for listener in self._listeners:
+            listener(archive_hash)
+
+
+# Function to measure a file or directory tree in bytes
+def _size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for directory, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(directory, filename))
+            except OSError:
+                pass  # removed by a concurrent conversion or eviction
+    return total
+
+
+# Process-wide workspace, shared by every session of the server
+default_workspace = Workspace()
@@ -0,0 +1,64 @@
+"""Loads served from the store still time every date folder and report skipped files"""
+
+import zipfile
+
+import numpy as np
+import pytest
+
+from line4 import AggregateStore, StageRecorder, ZipDataset, parse, plan, stream_folder_stats
+from line4.schema import QuarantineLog
+from line4.synth import iter_members, make_csv, write_archive
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / 'line4.zip'
+    write_archive(path, bases=2, dates=3, files=2, beads=10, rows=5)
+    return ZipDataset(str(path))
+
+
+# Function to load a whole archive under a recorder, returning the stages and dates it timed
+def profiled_load(dataset, store):
+    partitions = plan(dataset, dataset.list_folders())
+    with StageRecorder(log=False) as recorder:
+        folders = dict(stream_folder_stats(dataset, partitions, 1, store))
+    assert sorted(folders) == dataset.list_folders()
+    dates = {(r['folder'], r['date']) for r in recorder.records if r['stage'] == 'aggregate'}
+    return {r['stage'] for r in recorder.records}, dates
+
+
+def test_aggregate_is_timed_cold_and_warm(archive, tmp_path):
+    expected = {(base, date) for base in archive.list_folders() for date in archive.list_folders(base)}
+    store = AggregateStore(str(tmp_path / 'aggregates.sqlite'))
+    try:
+        cold, cold_dates = profiled_load(archive, store)
+        warm, warm_dates = profiled_load(archive, store)
+    finally:
+        store.close()
+    assert {'aggregate', 'parse'} <= cold
+    assert cold_dates == expected
+    assert 'aggregate' in warm and 'parse' not in warm
+    assert warm_dates == expected
+
+
+def test_quarantine_survives_store_hits(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(parse, 'default_quarantine', QuarantineLog(str(tmp_path / 'quarantine')))
+    bad = 'Line4_01/2024-11-01/bad.csv'
+    for name, extra in (('old.zip', False), ('new.zip', True)):
+        with zipfile.ZipFile(tmp_path / name, 'w') as f:
+            for member, data in iter_members(bases=1, dates=2, files=2, beads=10, rows=5):
+                f.writestr(member, data)
+            f.writestr(bad, b'Ch01,1.0,oops\n')
+            if extra:
+                f.writestr('Line4_01/2024-11-09/new.csv', make_csv(np.random.default_rng(1), 5, 10))
+    store = AggregateStore(str(tmp_path / 'aggregates.sqlite'))
+    try:
+        for name in ('old.zip', 'new.zip'):
+            dataset = ZipDataset(str(tmp_path / name))
+            list(stream_folder_stats(dataset, plan(dataset, dataset.list_folders()), 1, store))
+            # The new archive's unchanged folder comes from the store, its bad file is still reported
+            assert list(parse.default_quarantine.report(dataset.fingerprint)) == [bad]
+    finally:
+        store.close()
@@ -0,0 +1,79 @@
+"""Serial, pooled and stored date aggregates must agree to the last bit"""
+
+import zipfile
+
+import numpy as np
+import pytest
+
+from line4 import AggregateStore, ZipDataset, date_stats, iter_date_stats, parallel, parse
+from line4.schema import QuarantineLog
+from line4.synth import iter_members, make_csv
+
+THRESHOLD = 100_000
+
+
+# Small synthetic archive with one oversized member and one malformed member
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(parse, 'CHUNK_THRESHOLD', THRESHOLD)
+    # Worker processes read the threshold from the environment when they start
+    monkeypatch.setenv('LINE4_CHUNK_THRESHOLD', str(THRESHOLD))
+    monkeypatch.setattr(parse, 'default_quarantine', QuarantineLog(str(tmp_path / 'quarantine')))
+    path = tmp_path / 'line4.zip'
+    with zipfile.ZipFile(path, 'w') as f:
+        for name, data in iter_members(bases=2, dates=3, files=3, beads=20, rows=5, bead_jitter=3):
+            f.writestr(name, data)
+        f.writestr('Line4_01/2024-11-02/2024-11-02_99999.csv',
+                   make_csv(np.random.default_rng(1), rows=2000, beads=20))
+        f.writestr('Line4_02/2024-11-03/2024-11-03_bad.csv', b'Ch01,1.0,oops\nCh02,2.0,3.0\n')
+    _reset_pool()
+    yield ZipDataset(str(path))
+    _reset_pool()
+
+
+def _reset_pool():
+    if parallel._executor is not None:
+        parallel._executor.shutdown()
+        parallel._executor = None
+
+
+def _paths(dataset):
+    return [f'{base}/{date}' for base in dataset.list_folders() for date in dataset.list_folders(base)]
+
+
+def assert_same(expected, actual):
+    assert expected.keys() == actual.keys()
+    for channel in expected:
+        np.testing.assert_array_equal(expected[channel].count, actual[channel].count)
+        np.testing.assert_array_equal(expected[channel].mean_, actual[channel].mean_)
+        np.testing.assert_array_equal(expected[channel].m2, actual[channel].m2)
+
+
+def test_archive_has_oversized_and_malformed_members(archive):
+    sizes = [archive.member_size(m) for path in _paths(archive) for m in archive.list_files(path)]
+    assert sum(size > THRESHOLD for size in sizes) == 1
+    date_stats(archive, 'Line4_02/2024-11-03')
+    assert list(parse.default_quarantine.report(archive.fingerprint)) == ['Line4_02/2024-11-03/2024-11-03_bad.csv']
+
+
+def test_pool_matches_serial(archive):
+    paths = _paths(archive)
+    serial = [date_stats(archive, path) for path in paths]
+    pooled = list(iter_date_stats(archive, paths, workers=2))
+    for expected, actual in zip(serial, pooled, strict=True):
+        assert_same(expected, actual)
+
+
+def test_store_matches_serial(archive, tmp_path):
+    paths = _paths(archive)
+    serial = [date_stats(archive, path) for path in paths]
+    store = AggregateStore(str(tmp_path / 'aggregates.sqlite'))
+    try:
+        cold = list(iter_date_stats(archive, paths, workers=1, store=store))
+        warm = list(iter_date_stats(archive, paths, workers=1, store=store))
+    finally:
+        store.close()
+    for expected, cold_partial, warm_partial in zip(serial, cold, warm, strict=True):
+        assert_same(expected, cold_partial)
+        assert_same(expected, warm_partial)